@@ -1,28 +1,59 @@
+import calendar
+import codecs
+import json
+import locale
+import multiprocessing
 import os
-import hashlib
+import secrets
+import shutil
+import signal
+import subprocess
+import sys
+import threading
+import time
 import uuid
-from datetime import datetime, timezone
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta, timezone
+from functools import lru_cache, wraps
+from hashlib import blake2b
 
 
 def utcnow():
     return datetime.now(timezone.utc)
 from pathlib import Path
-from flask import Flask, request, render_template, jsonify, send_file, session, redirect, url_for, flash, g
-from urllib.parse import urlparse
-from flask_login import LoginManager, login_user, logout_user, login_required, current_user
-from werkzeug.utils import secure_filename
-import unicodedata
-from models import db, User, Task, SystemStats, ServerConfig, Node
+import chardet
+from types import MappingProxyType
+from celery import Celery
+from flask.json.provider import DefaultJSONProvider
+from jinja2 import FileSystemBytecodeCache
+from flask import Flask, Response, request, render_template, jsonify, send_file, session, redirect, url_for, flash, g
+from urllib.parse import urlparse, quote, unquote
+from sqlalchemy.orm import load_only, raiseload, selectinload
+from flask_login import LoginManager, UserMixin, login_user, logout_user, login_required, current_user
+from models import db, User, Task, ServerConfig, Node, remove_files, uuid7
 from forms import LoginForm, RegistrationForm, ChangePasswordForm
 from config import Config
-# Import moved to avoid circular import
+
+try:
+    import orjson
+except ImportError:  # optional: jsonify falls back to the stdlib encoder
+    orjson = None
+
+try:
+    import psutil
+except ImportError:  # optional: resource usage reads as 0 without it
+    psutil = None
+
+# Celery client used only to publish and revoke work. The task definitions
+# live in tasks.py (which imports this module), so they are sent by name.
+_celery = Celery(set_as_current=False, config_source=Config)
 
 def _localtime(dt, fmt='%Y-%m-%d %H:%M'):
     """Convert a UTC datetime (aware or naive) to server local time and format it."""
     if dt is None:
         return '—'
     try:
-        import calendar
         if dt.tzinfo is not None:
             ts = dt.timestamp()
         else:
@@ -32,16 +63,118 @@ def _localtime(dt, fmt='%Y-%m-%d %H:%M'):
     except Exception:
         return str(dt)
 
+class _JSONProvider(DefaultJSONProvider):
+    """Flask JSON provider that encodes with orjson when it is installed"""
+
+    def dumps(self, obj, **kwargs):
+        # jsonify and the session serializer only pass formatting options;
+        # anything else means the caller needs the stdlib encoder.
+        if orjson is None or kwargs.keys() - {'indent', 'separators'}:
+            return super().dumps(obj, **kwargs)
+        # Non-str keys are coerced like the stdlib encoder; anything orjson
+        # can't encode natively goes through Flask's default hook. Datetimes
+        # are encoded natively as RFC 3339, with naive (SQLite) values marked
+        # as the UTC they are stored in.
+        option = orjson.OPT_NON_STR_KEYS | orjson.OPT_NAIVE_UTC
+        if kwargs.get('indent'):
+            option |= orjson.OPT_INDENT_2
+        return orjson.dumps(obj, default=self.default, option=option).decode()
+
+    def loads(self, s, **kwargs):
+        # object_hook etc. (used by the tagged session serializer) need the stdlib
+        if orjson is None or kwargs:
+            return super().loads(s, **kwargs)
+        return orjson.loads(s)
+
+def _ttl_cache(ttl):
+    """Memoize a no-argument function for ttl seconds; call .cache_clear() to drop it"""
+    def decorator(fn):
+        lock = threading.Lock()
+        state = {'expires': 0.0, 'value': None}
+
+        @wraps(fn)
+        def wrapper():
+            if time.monotonic() >= state['expires']:
+                with lock:
+                    # Re-check: another thread may have refreshed while we waited
+                    if time.monotonic() >= state['expires']:
+                        state['value'] = fn()
+                        state['expires'] = time.monotonic() + ttl
+            return state['value']
+
+        def cache_clear():
+            state['expires'] = 0.0
+
+        wrapper.cache_clear = cache_clear
+        return wrapper
+    return decorator
+
+_USER_SESSION_KEY = '_user_cache'
+_user_cache_epoch = {}  # user id -> bump count; stale session snapshots reload
+# Re-read the row this often even without an explicit bump, so changes made by
+# another process (or before a restart) are picked up
+USER_CACHE_TTL = 30  # seconds
+
+def _remember_user(user):
+    """Stash the fields most requests need so load_user can skip the SELECT"""
+    session[_USER_SESSION_KEY] = {
+        'id': user.id,
+        'username': user.username,
+        'is_admin': user.is_admin,
+        'is_active': user.is_active,  # UserMixin.is_authenticated follows it
+        'must_change_password': user.must_change_password,
+        'epoch': _user_cache_epoch.get(user.id, 0),
+        'at': time.time(),
+    }
+
+def _forget_user(user_id):
+    """Invalidate every session snapshot of this user"""
+    _user_cache_epoch[user_id] = _user_cache_epoch.get(user_id, 0) + 1
+
+class _SessionUser(UserMixin):
+    """current_user rebuilt from the session; loads the real row on first miss"""
+
+    get_user_folder = User.get_user_folder
+    is_administrator = User.is_administrator
+
+    def __init__(self, data):
+        self.id = data['id']
+        self.username = data['username']
+        self.is_admin = data['is_admin']
+        self._is_active = data['is_active']
+        self.must_change_password = data['must_change_password']
+        self.user_folder = User.folder_for(self.id)
+        self._row = None
+
+    @property
+    def is_active(self):
+        return self._is_active
+
+    def __getattr__(self, name):
+        # Only reached for attributes not cached above (check_password, tasks, ...)
+        if name.startswith('__') or name == '_row':
+            raise AttributeError(name)
+        if self._row is None:
+            self._row = db.session.get(User, self.id)
+            if self._row is None:
+                raise AttributeError(name)
+        return getattr(self._row, name)
+
 def create_app():
     app = Flask(__name__)
     app.config.from_object(Config)
     
     # Ensure proper encoding for Chinese characters
     app.config['JSON_AS_ASCII'] = False
+    app.json = _JSONProvider(app)
+    app.json.ensure_ascii = False
     
     # Register local-time filter for templates
     app.jinja_env.filters['localtime'] = _localtime
 
+    # Persist compiled templates so a restarted server skips the Jinja compile step
+    app.jinja_env.bytecode_cache = FileSystemBytecodeCache(str(Config.JINJA_CACHE_FOLDER))
+
     # Initialize extensions
     db.init_app(app)
     Config.init_app(app)
@@ -54,7 +187,16 @@ def create_app():
     
     @login_manager.user_loader
     def load_user(user_id):
-        return User.query.get(user_id)
+        data = session.get(_USER_SESSION_KEY)
+        if (data and data['id'] == user_id
+                and 'is_active' in data  # snapshots from before it was stored
+                and data['epoch'] == _user_cache_epoch.get(user_id, 0)
+                and time.time() - data.get('at', 0) < USER_CACHE_TTL):
+            return _SessionUser(data)
+        user = db.session.get(User, user_id)
+        if user is not None:
+            _remember_user(user)
+        return user
     
     # Create database tables
     with app.app_context():
@@ -73,21 +215,12 @@ def create_admin_user():
         db.session.commit()
 
         # Create admin directories
-        user_folder = admin.get_user_folder()
-        folder_mapping = {
-            'uploads': Config.UPLOAD_FOLDER,
-            'results': Config.RESULTS_FOLDER,
-            'logs': Config.LOGS_FOLDER
-        }
-        for folder_type, base_folder in folder_mapping.items():
-            folder_path = base_folder / user_folder
-            folder_path.mkdir(parents=True, exist_ok=True)
+        Config.ensure_user_dirs(admin.user_folder)
 
         print("Admin user created. Please log in and change the default password immediately.")
 
 def admin_required(f):
     """Decorator to require admin privileges"""
-    from functools import wraps
     @wraps(f)
     def decorated_function(*args, **kwargs):
         if not current_user.is_authenticated or not current_user.is_administrator():
@@ -96,399 +229,57 @@ def admin_required(f):
         return f(*args, **kwargs)
     return decorated_function
 
+def _own_task(task_id):
+    """The current user's task by primary key (identity map first), or None
+    if it does not exist or belongs to someone else"""
+    task = db.session.get(Task, task_id)
+    if task is None or task.user_id != current_user.id:
+        return None
+    return task
+
+def _node_task(task_id, node):
+    """Task by primary key if it is assigned to the given node, else None"""
+    task = db.session.get(Task, task_id)
+    if task is None or task.assigned_node_id != node.id:
+        return None
+    return task
+
 app = create_app()
 
-# Language translations
-TRANSLATIONS = {
-    'zh': {
-        # Navigation
-        'title': 'COMSOL® 仿真管理系统',
-        'home': '首页',
-        'history': '历史记录',
-        'queue_status': '队列状态',
-        'admin': '管理',
-        'dashboard': '控制台',
-        'user_management': '用户管理',
-        'task_management': '任务管理',
-        'change_password': '修改密码',
-        'logout': '退出',
-        'login': '登录',
-        'register': '注册',
-        'administrator': '管理员',
-        'language': '语言',
-        'chinese': '中文',
-        'english': 'English',
-        'version': '版本',
-        
-        # Main page content
-        'upload_simulation_file': '上传仿真文件',
-        'select_mph_file': '选择 .mph 文件',
-        'only_mph_format': '仅支持 COMSOL® .mph 格式文件',
-        'task_priority': '任务优先级',
-        'normal_priority': '普通优先级',
-        'high_priority': '高优先级',
-        'upload_and_start': '上传并开始仿真',
-        'system_status': '系统状态',
-        'pending': '等待中',
-        'running': '运行中',
-        'completed_today': '今日完成',
-        'failed_today': '今日失败',
-        'my_tasks': '我的任务',
-        'refresh': '刷新',
-        'no_tasks': '暂无任务记录',
-        'task_logs': '任务日志',
-        
-        # Table headers
-        'filename': '文件名',
-        'status': '状态',
-        'priority': '优先级',
-        'progress': '进度',
-        'created_time': '创建时间',
-        'actions': '操作',
-        
-        # Status labels
-        'completed': '已完成',
-        'failed': '失败',
-        'cancelled': '已取消',
-        'pending': '待处理',
-        'normal': '普通',
-        'high': '高优先级',
-        
-        # Action buttons
-        'download': '下载',
-        'logs': '日志',
-        'cancel': '取消',
-        'delete': '删除',
-        'cancel_task': '取消任务',
-        'delete_task': '删除任务',
-        
-        # Login page
-        'user_login': '用户登录',
-        'username': '用户名',
-        'password': '密码',
-        'login_button': '登录',
-        'no_account': '还没有账户？',
-        'register_now': '立即注册',
-        
-        # History page
-        'task_history': '任务历史记录',
-        'completion_time': '完成时间',
-        'execution_time': '执行时长',
-        'no_history': '暂无历史记录',
-        'no_tasks_submitted': '您还没有提交过任何仿真任务',
-        'upload_first_file': '上传第一个文件',
-        'error_info': '错误信息',
-        
-        # Queue Status page
-        'task_queue': '任务队列',
-        'waiting_queue': '等待队列',
-        'running_queue': '运行中',
-        'queue_empty': '队列为空',
-        'no_running_tasks': '无运行任务',
-        'system_statistics': '系统统计',
-        'cpu_usage': 'CPU 使用率',
-        'memory_usage': '内存使用率',
-        'disk_usage': '磁盘使用率',
-        'avg_queue_time': '平均排队时间',
-        'avg_execution_time': '平均执行时间',
-        'update_time': '更新时间',
-        'realtime_data': '实时数据',
-        'no_statistics': '暂无统计数据',
-        'start_time': '开始时间',
-        'unknown_time': '未知时间',
-        
-        # Registration page
-        'user_registration': '用户注册',
-        'username_length': '用户名长度为3-20个字符',
-        'password_length': '密码至少6个字符',
-        'have_account': '已有账户？',
-        'login_now': '立即登录',
-        'confirm_password': '确认密码',
-        
-        # Admin pages
-        'admin_dashboard': '管理控制台',
-        'total_users': '总用户数',
-        'total_tasks': '总任务数',
-        'active_tasks': '活跃任务',
-        'active_users': '活跃用户',
-        'system_load': '系统负载',
-        'recent_activities': '最近活动',
-        'user_registered': '用户注册',
-        'task_submitted': '任务提交',
-        'task_completed': '任务完成',
-        'view_all': '查看全部',
-        'recent_registered_users': '最近注册用户',
-        'registration_time': '注册时间',
-        'active': '活跃',
-        'disabled': '禁用',
-        'quick_actions': '快速操作',
-        'manage_users': '管理用户',
-        'manage_tasks': '管理任务',
-        'view_queue': '查看队列',
-        'all_users': '所有用户',
-        'total_users_count': '共',
-        'users_count': '个用户',
-        'role': '角色',
-        'last_login': '最后登录',
-        'task_count': '任务数',
-        'all_tasks': '所有任务',
-        'total_tasks_count': '共',
-        'tasks_count': '个任务',
-        'task_id': '任务ID',
-        'user': '用户',
-        'actions': '操作',
-        'created_time': '创建时间',
-        'execution_time': '执行时间',
-        'normal_priority': '普通',
-        'refresh': '刷新',
-        'task_status_statistics': '任务状态统计',
-        'system_information': '系统信息',
-        'in_progress': '进行中',
-        'total_task_count': '总任务数',
-        'average_execution_time': '平均执行时间',
-        'no_data': '暂无数据',
-        'normal_user': '普通用户',
-        'never_logged_in': '从未登录',
-        'disable_user': '禁用',
-        'enable_user': '启用',
-        'delete_user': '删除',
-        'system_admin': '系统管理员',
-        'confirm_disable_user': '确定要禁用用户',
-        'confirm_delete_user': '确定要删除用户',
-        'delete_warning': '及其所有数据吗？此操作不可恢复！',
-        
-        # File input
-        'choose_file': '选择文件',
-        'no_file_chosen': '未选择文件',
-        
-        # Change password page
-        'current_password': '当前密码',
-        'new_password': '新密码',
-        'confirm_new_password': '确认新密码',
-        'change_password_title': '修改密码',
-        'password_changed_success': '密码修改成功',
-        
-        # Form labels from forms.py
-        'username_label': '用户名',
-        'password_label': '密码',
-        'confirm_password_label': '确认密码',
-        'login_submit': '登录',
-        'register_submit': '注册',
-        'change_password_submit': '修改密码',
-        'username_exists': '用户名已存在，请选择其他用户名。',
-        'password_mismatch': '两次输入的密码不一致',
-        'current_password_incorrect': '当前密码不正确。',
-        
-        # Common
-        'submit': '提交',
-        'close': '关闭',
-        'save': '保存',
-        'cancel_action': '取消'
-    },
-    'en': {
-        # Navigation
-        'title': 'COMSOL® Simulation Management System',
-        'home': 'Home',
-        'history': 'History',
-        'queue_status': 'Queue Status',
-        'admin': 'Admin',
-        'dashboard': 'Dashboard',
-        'user_management': 'User Management',
-        'task_management': 'Task Management',
-        'change_password': 'Change Password',
-        'logout': 'Logout',
-        'login': 'Login',
-        'register': 'Register',
-        'administrator': 'Admin',
-        'language': 'Language',
-        'chinese': '中文',
-        'english': 'English',
-        'version': 'Version',
-        
-        # Main page content
-        'upload_simulation_file': 'Upload Simulation File',
-        'select_mph_file': 'Select .mph File',
-        'only_mph_format': 'Only COMSOL® .mph format files supported',
-        'task_priority': 'Task Priority',
-        'normal_priority': 'Normal Priority',
-        'high_priority': 'High Priority',
-        'upload_and_start': 'Upload and Start Simulation',
-        'system_status': 'System Status',
-        'pending': 'Pending',
-        'running': 'Running',
-        'completed_today': 'Completed Today',
-        'failed_today': 'Failed Today',
-        'my_tasks': 'My Tasks',
-        'refresh': 'Refresh',
-        'no_tasks': 'No task records',
-        'task_logs': 'Task Logs',
-        
-        # Table headers
-        'filename': 'Filename',
-        'status': 'Status',
-        'priority': 'Priority',
-        'progress': 'Progress',
-        'created_time': 'Created Time',
-        'actions': 'Actions',
-        
-        # Status labels
-        'completed': 'Completed',
-        'failed': 'Failed',
-        'cancelled': 'Cancelled',
-        'pending': 'Pending',
-        'normal': 'Normal',
-        'high': 'High Priority',
-        
-        # Action buttons
-        'download': 'Download',
-        'logs': 'Logs',
-        'cancel': 'Cancel',
-        'delete': 'Delete',
-        'cancel_task': 'Cancel Task',
-        'delete_task': 'Delete Task',
-        
-        # Login page
-        'user_login': 'User Login',
-        'username': 'Username',
-        'password': 'Password',
-        'login_button': 'Login',
-        'no_account': "Don't have an account?",
-        'register_now': 'Register Now',
-        
-        # History page
-        'task_history': 'Task History',
-        'completion_time': 'Completion Time',
-        'execution_time': 'Execution Time',
-        'no_history': 'No History Records',
-        'no_tasks_submitted': 'You have not submitted any simulation tasks yet',
-        'upload_first_file': 'Upload First File',
-        'error_info': 'Error Information',
-        
-        # Queue Status page
-        'task_queue': 'Task Queue',
-        'waiting_queue': 'Waiting Queue',
-        'running_queue': 'Running',
-        'queue_empty': 'Queue is Empty',
-        'no_running_tasks': 'No Running Tasks',
-        'system_statistics': 'System Statistics',
-        'cpu_usage': 'CPU Usage',
-        'memory_usage': 'Memory Usage',
-        'disk_usage': 'Disk Usage',
-        'avg_queue_time': 'Average Queue Time',
-        'avg_execution_time': 'Average Execution Time',
-        'update_time': 'Update Time',
-        'realtime_data': 'Real-time Data',
-        'no_statistics': 'No Statistics Available',
-        'start_time': 'Start Time',
-        'unknown_time': 'Unknown Time',
-        
-        # Registration page
-        'user_registration': 'User Registration',
-        'username_length': 'Username length: 3-20 characters',
-        'password_length': 'Password minimum 6 characters',
-        'have_account': 'Already have an account?',
-        'login_now': 'Login Now',
-        'confirm_password': 'Confirm Password',
-        
-        # Admin pages
-        'admin_dashboard': 'Admin Dashboard',
-        'total_users': 'Total Users',
-        'total_tasks': 'Total Tasks',
-        'active_tasks': 'Active Tasks',
-        'active_users': 'Active Users',
-        'system_load': 'System Load',
-        'recent_activities': 'Recent Activities',
-        'user_registered': 'User Registered',
-        'task_submitted': 'Task Submitted',
-        'task_completed': 'Task Completed',
-        'view_all': 'View All',
-        'recent_registered_users': 'Recent Registered Users',
-        'registration_time': 'Registration Time',
-        'active': 'Active',
-        'disabled': 'Disabled',
-        'quick_actions': 'Quick Actions',
-        'manage_users': 'Manage Users',
-        'manage_tasks': 'Manage Tasks',
-        'view_queue': 'View Queue',
-        
-        # File input
-        'choose_file': 'Choose File',
-        'no_file_chosen': 'No File Chosen',
-        
-        # Change password page
-        'current_password': 'Current Password',
-        'new_password': 'New Password',
-        'confirm_new_password': 'Confirm New Password',
-        'change_password_title': 'Change Password',
-        'password_changed_success': 'Password changed successfully',
-        
-        # Form labels from forms.py
-        'username_label': 'Username',
-        'password_label': 'Password',
-        'confirm_password_label': 'Confirm Password',
-        'login_submit': 'Login',
-        'register_submit': 'Register',
-        'change_password_submit': 'Change Password',
-        'username_exists': 'Username already exists, please choose another.',
-        'password_mismatch': 'Passwords do not match',
-        'current_password_incorrect': 'Current password is incorrect.',
-        
-        # Admin users page
-        'all_users': 'All Users',
-        'total_users_count': 'Total Users',
-        'role': 'Role',
-        'last_login': 'Last Login',
-        'task_count': 'Task Count',
-        
-        # Admin tasks page
-        'all_tasks': 'All Tasks',
-        'total_tasks_count': 'Total',
-        'tasks_count': 'Tasks',
-        'task_id': 'Task ID',
-        'user': 'User',
-        'actions': 'Actions',
-        'created_time': 'Created Time',
-        'execution_time': 'Execution Time',
-        'normal_priority': 'Normal',
-        'refresh': 'Refresh',
-        'task_status_statistics': 'Task Status Statistics',
-        'system_information': 'System Information',
-        'in_progress': 'In Progress',
-        'total_task_count': 'Total Tasks',
-        'average_execution_time': 'Average Execution Time',
-        'no_data': 'No Data',
-        'normal_user': 'Normal User',
-        'never_logged_in': 'Never Logged In',
-        'disable_user': 'Disable',
-        'enable_user': 'Enable',
-        'delete_user': 'Delete',
-        'system_admin': 'System Administrator',
-        'confirm_disable_user': 'Are you sure you want to disable user',
-        'confirm_delete_user': 'Are you sure you want to delete user',
-        'delete_warning': 'and all their data? This action cannot be undone!',
-        
-        # Common
-        'submit': 'Submit',
-        'close': 'Close',
-        'save': 'Save',
-        'cancel_action': 'Cancel'
-    }
-}
+# Language translations, one JSON file per language under i18n/
+I18N_FOLDER = Path(__file__).resolve().parent / 'i18n'
+
+def _load_translations(lang):
+    """Load i18n/<lang>.json into a read-only mapping with interned keys"""
+    def build(pairs):
+        table = {}
+        for key, value in pairs:
+            if key in table:
+                app.logger.warning('Duplicate translation key %r in %s.json', key, lang)
+            table[sys.intern(key)] = value
+        return table
+    with open(I18N_FOLDER / f'{lang}.json', encoding='utf-8') as f:
+        return MappingProxyType(json.load(f, object_pairs_hook=build))
+
+TRANSLATIONS = MappingProxyType({lang: _load_translations(lang) for lang in ('zh', 'en')})
 
 def get_language():
     """Get current language from session or default to Chinese"""
     return session.get('language', 'en')
 
-def get_text(key):
-    """Get translated text for current language"""
-    lang = get_language()
-    return TRANSLATIONS.get(lang, TRANSLATIONS['zh']).get(key, key)
+def _make_get_text(table):
+    """Build a key -> text lookup bound to one language table"""
+    get = table.get
+    return lambda key: get(key, key)
+
+# One lookup per language, resolved once per request in before_request
+_GET_TEXT = {lang: _make_get_text(table) for lang, table in TRANSLATIONS.items()}
 
 @app.before_request
 def before_request():
     """Set up language context before each request"""
     g.language = get_language()
-    g.get_text = get_text
+    g.get_text = _GET_TEXT.get(g.language, _GET_TEXT['zh'])
     g.config = Config
 
 @app.route('/set_language/<language>')
@@ -512,7 +303,10 @@ def login():
         user = User.query.filter_by(username=form.username.data).first()
         if user and user.check_password(form.password.data):
             login_user(user)
+            _remember_user(user)
             user.last_seen = utcnow()
+            if user.needs_rehash():
+                user.set_password(form.password.data)
             db.session.commit()
             if user.must_change_password:
                 flash('首次登录请修改默认密码。')
@@ -529,6 +323,7 @@ def login():
 def logout():
     """User logout"""
     logout_user()
+    session.pop(_USER_SESSION_KEY, None)
     return redirect(url_for('login'))
 
 @app.route('/register', methods=['GET', 'POST'])
@@ -543,42 +338,80 @@ def register():
         user.set_password(form.password.data)
         db.session.add(user)
         db.session.commit()
+        _invalidate_counts()
         
         # Create user-specific directories
-        user_folder = user.get_user_folder()
-        folder_mapping = {
-            'uploads': Config.UPLOAD_FOLDER,
-            'results': Config.RESULTS_FOLDER,
-            'logs': Config.LOGS_FOLDER
-        }
-        for folder_type, base_folder in folder_mapping.items():
-            folder_path = base_folder / user_folder
-            folder_path.mkdir(parents=True, exist_ok=True)
+        Config.ensure_user_dirs(user.user_folder)
         
         flash('注册成功！请登录。')
         return redirect(url_for('login'))
     return render_template('register.html', form=form)
 
+# Headline counters change slowly relative to how often these pages are polled,
+# so concurrent viewers share one result for a few seconds.
+COUNTS_CACHE_TTL = 5
+
+@_ttl_cache(COUNTS_CACHE_TTL)
+def _dashboard_counts():
+    """(total_users, active_users, total_tasks, active_tasks) in a single round trip"""
+    return tuple(db.session.execute(db.select(
+        db.select(db.func.count(User.id)).scalar_subquery(),
+        db.select(db.func.count(User.id)).where(User.is_active.is_(True)).scalar_subquery(),
+        db.select(db.func.count(Task.id)).scalar_subquery(),
+        db.select(db.func.count(Task.id))
+          .where(Task.status.in_(['pending', 'running'])).scalar_subquery(),
+    )).one())
+
+@_ttl_cache(COUNTS_CACHE_TTL)
+def _task_stats():
+    """Task.stats(), shared between viewers for COUNTS_CACHE_TTL seconds"""
+    return Task.stats()
+
+def _invalidate_counts():
+    """Drop cached counters after a change made by this process"""
+    _dashboard_counts.cache_clear()
+    _task_stats.cache_clear()
+    _api_stats_payload.cache_clear()
+
 @app.route('/admin')
 @login_required
 @admin_required
 def admin_dashboard():
     """Admin dashboard"""
-    users = User.query.all()
-    total_tasks = Task.query.count()
-    active_tasks = Task.query.filter(Task.status.in_(['pending', 'running'])).count()
+    total_users, active_users, total_tasks, active_tasks = _dashboard_counts()
+    recent_users = (User.query
+                    .options(load_only(User.id, User.username, User.is_admin,
+                                       User.is_active, User.created_at))
+                    .order_by(User.created_at.desc())
+                    .limit(5)
+                    .all())
     nodes = Node.query.order_by(Node.registered_at).all()
     online_nodes = sum(1 for n in nodes if n.status in ('online', 'busy'))
-    return render_template('admin/dashboard.html', users=users, total_tasks=total_tasks,
-                           active_tasks=active_tasks, nodes=nodes, online_nodes=online_nodes)
+    return render_template('admin/dashboard.html', recent_users=recent_users,
+                           total_users=total_users, active_users=active_users,
+                           total_tasks=total_tasks, active_tasks=active_tasks,
+                           nodes=nodes, online_nodes=online_nodes)
+
+USERS_PAGE_SIZE = 50
 
 @app.route('/admin/users')
 @login_required
 @admin_required
 def admin_users():
     """Admin user management"""
-    users = User.query.all()
-    return render_template('admin/users.html', users=users)
+    page = request.args.get('page', 1, type=int)
+    # Count tasks in SQL rather than loading user.tasks once per row
+    task_count = (db.select(db.func.count(Task.id))
+                  .where(Task.user_id == User.id)
+                  .correlate(User)
+                  .scalar_subquery())
+    pagination = (User.query
+                  .options(load_only(User.id, User.username, User.is_admin, User.is_active,
+                                     User.created_at, User.last_seen))
+                  .add_columns(task_count.label('task_count'))
+                  .order_by(User.created_at)
+                  .paginate(page=page, per_page=USERS_PAGE_SIZE, error_out=False))
+    return render_template('admin/users.html', users=pagination.items, pagination=pagination)
 
 @app.route('/admin/user/<user_id>/toggle', methods=['POST'])
 @login_required
@@ -596,6 +429,9 @@ def admin_toggle_user(user_id):
     else:
         user.activate()
         flash(f'用户 {user.username} 已被启用')
+    # After the commit, so no request can re-snapshot the old row meanwhile
+    _forget_user(user.id)
+    _invalidate_counts()
     
     return redirect(url_for('admin_users'))
 
@@ -604,29 +440,29 @@ def admin_toggle_user(user_id):
 @admin_required
 def admin_delete_user(user_id):
     """Delete user and all associated data"""
-    user = User.query.get_or_404(user_id)
+    user = User.query.options(selectinload(User.tasks)).filter_by(id=user_id).first_or_404()
     if user.username == 'admin':
         flash('无法删除管理员账户')
         return redirect(url_for('admin_users'))
     
     try:
         # Delete all user tasks (will cascade delete files)
+        user_folder = user.user_folder
         for task in user.tasks:
             task.cleanup_files()
         
         # Delete user directories
-        user_folder = user.get_user_folder()
-        import shutil
-        for folder_type, base_folder in [('uploads', Config.UPLOAD_FOLDER), 
-                                       ('results', Config.RESULTS_FOLDER), 
-                                       ('logs', Config.LOGS_FOLDER)]:
+        for base_folder in Config.USER_FOLDER_BASES:
             folder_path = base_folder / user_folder
             if folder_path.exists():
                 shutil.rmtree(folder_path, ignore_errors=True)
+        Config.forget_user_dirs(user_folder)
         
         # Delete user from database
         db.session.delete(user)
         db.session.commit()
+        _forget_user(user.id)
+        _invalidate_counts()
         flash(f'用户 {user.username} 及其所有数据已被删除')
     except Exception as e:
         db.session.rollback()
@@ -639,9 +475,23 @@ def admin_delete_user(user_id):
 @admin_required
 def admin_tasks():
     """Admin task management"""
-    tasks = Task.query.order_by(Task.created_at.desc()).all()
+    tasks = (Task.query
+             .options(selectinload(Task.user), selectinload(Task.node), raiseload('*'))
+             .order_by(Task.created_at.desc())
+             .all())
     return render_template('admin/tasks.html', tasks=tasks)
 
+# Page size for the task list endpoints; /tasks callers may ask for up to
+# TASKS_MAX_LIMIT rows at once via ?limit=.
+TASKS_PAGE_SIZE = 50
+TASKS_MAX_LIMIT = 200
+
+# Buffer size for streaming uploads straight to disk
+UPLOAD_CHUNK_SIZE = 4 * 1024 * 1024
+
+# Path separators, other characters Windows rejects, and control characters
+_UNSAFE_FILENAME_CHARS = dict.fromkeys([*range(32), *map(ord, '<>:"/\\|?*')])
+
 def secure_chinese_filename(filename):
     """Secure filename while preserving Chinese characters"""
     if not filename:
@@ -649,11 +499,7 @@ def secure_chinese_filename(filename):
     
     # Keep the original filename but remove dangerous characters
     # Allow Chinese characters, alphanumeric, dots, hyphens, underscores
-    import re
-    # Remove path separators and other dangerous characters
-    filename = re.sub(r'[<>:"/\\|?*]', '', filename)
-    # Remove control characters
-    filename = ''.join(char for char in filename if ord(char) >= 32)
+    filename = filename.translate(_UNSAFE_FILENAME_CHARS)
     # Limit length
     if len(filename) > 255:
         name, ext = os.path.splitext(filename)
@@ -661,17 +507,27 @@ def secure_chinese_filename(filename):
     
     return filename.strip()
 
+# Normalised once so entries like '.MPH' in the config still match
+_ALLOWED_EXTENSIONS = frozenset(ext.lower().lstrip('.') for ext in Config.ALLOWED_EXTENSIONS)
+
 def allowed_file(filename):
     """Check if file extension is allowed"""
-    return '.' in filename and \
-           filename.rsplit('.', 1)[1].lower() in Config.ALLOWED_EXTENSIONS
+    _, dot, ext = filename.rpartition('.')
+    return bool(dot) and ext.lower() in _ALLOWED_EXTENSIONS
+
+def _stream_to_file(src, dst_path, chunk_size=UPLOAD_CHUNK_SIZE):
+    """Copy a readable stream to dst_path in large chunks; returns bytes written"""
+    written = 0
+    with open(dst_path, 'wb') as dst:
+        while chunk := src.read(chunk_size):
+            dst.write(chunk)
+            written += len(chunk)
+    return written
 
 def generate_unique_filename(original_filename):
     """Generate unique filename while preserving extension"""
     name, ext = os.path.splitext(original_filename)
-    timestamp = datetime.now(timezone.utc).strftime('%Y%m%d_%H%M%S')
-    unique_id = str(uuid.uuid4())[:8]
-    return f"{name}_{timestamp}_{unique_id}{ext}"
+    return f"{name}_{time.time_ns()}_{secrets.token_hex(4)}{ext}"
 
 @app.route('/')
 @login_required
@@ -684,59 +540,72 @@ def index():
 @login_required
 def upload_file():
     """Handle file upload and queue simulation task"""
-    if 'file' not in request.files:
-        return jsonify({'error': 'No file selected'}), 400
-    
-    file = request.files['file']
-    if file.filename == '':
+    if request.mimetype == 'application/octet-stream':
+        # Raw-body upload: the file is the request body and the form fields
+        # travel in the query string, so the data never goes through
+        # Werkzeug's multipart parser.
+        file = None
+        filename = unquote(request.headers.get('X-Filename', ''))
+        fields = request.args
+        if not request.content_length:
+            return jsonify({'error': 'No file selected'}), 400
+    else:
+        if 'file' not in request.files:
+            return jsonify({'error': 'No file selected'}), 400
+        file = request.files['file']
+        filename = file.filename
+        fields = request.form
+
+    if filename == '':
         return jsonify({'error': 'No file selected'}), 400
     
-    if not allowed_file(file.filename):
+    if not allowed_file(filename):
         return jsonify({'error': 'Invalid file type. Only .mph files are allowed'}), 400
+
+    # Get priority and COMSOL version from the form / query string
+    priority = fields.get('priority', 'normal')
+    comsol_version = fields.get('comsol_version', Config.DEFAULT_COMSOL_VERSION)
+
+    # Validate COMSOL version before anything is written to disk
+    if comsol_version not in Config.COMSOL_VERSIONS:
+        return jsonify({'error': 'Invalid COMSOL version selected'}), 400
     
     try:
         # Generate unique filename with Chinese character support
-        original_filename = secure_chinese_filename(file.filename)
+        original_filename = secure_chinese_filename(filename)
         unique_filename = generate_unique_filename(original_filename)
         
         # Save uploaded file to user-specific folder
-        user_folder = current_user.get_user_folder()
-        user_upload_path = Config.UPLOAD_FOLDER / user_folder
-        user_upload_path.mkdir(parents=True, exist_ok=True)
-        upload_path = user_upload_path / unique_filename
-        file.save(upload_path)
-        
-        # Get priority and COMSOL version from form
-        priority = request.form.get('priority', 'normal')
-        comsol_version = request.form.get('comsol_version', Config.DEFAULT_COMSOL_VERSION)
+        user_folder = current_user.user_folder
+        Config.ensure_user_dirs(user_folder)
+        upload_path = Config.UPLOAD_FOLDER / user_folder / unique_filename
+        src = request.stream if file is None else file.stream
+        file_size = _stream_to_file(src, upload_path)
         
-        # Validate COMSOL version
-        if comsol_version not in Config.COMSOL_VERSIONS:
-            return jsonify({'error': 'Invalid COMSOL version selected'}), 400
-        
-        # Create task record
+        # Create task record; the id is set here so the Celery message can be
+        # built before the row is written
+        task_id = uuid7()
         task = Task(
+            id=task_id,
             user_id=current_user.id,
             original_filename=original_filename,
             unique_filename=unique_filename,
-            file_size=upload_path.stat().st_size,
+            file_size=file_size,
             priority=priority,
             comsol_version=comsol_version
         )
         db.session.add(task)
-        db.session.commit()
         
-        # Prepare result path, then dispatch to a node or local Celery worker
-        result_filename = f"{Path(unique_filename).stem}_solved.mph"
-        user_results_path = Config.RESULTS_FOLDER / user_folder
-        user_results_path.mkdir(parents=True, exist_ok=True)
-        result_path = user_results_path / result_filename
+        # Dispatch to a node or local Celery worker; this commits the new row
+        # together with its assignment. The worker creates the results folder.
+        result_path = task.results_dir / task.solved_filename
 
         dispatch_info = _dispatch_task(task, upload_path, result_path)
+        _invalidate_counts()
 
         return jsonify({
             'success': True,
-            'task_id': task.id,
+            'task_id': task_id,
             'message': 'File uploaded and pending for processing',
             'dispatch': dispatch_info,
         })
@@ -755,56 +624,87 @@ def upload_file():
 @login_required
 def get_tasks():
     """Get user's tasks with status"""
-    tasks = Task.query.filter_by(user_id=current_user.id).order_by(Task.created_at.desc()).all()
+    # Polls mostly see unchanged state: answer those from one aggregate row
+    etag = _tasks_etag(current_user.id)
+    if request.if_none_match.contains(etag):
+        response = app.response_class(status=304)
+    else:
+        limit = min(max(request.args.get('limit', TASKS_PAGE_SIZE, type=int), 1), TASKS_MAX_LIMIT)
+        offset = max(request.args.get('offset', 0, type=int), 0)
+        response = jsonify(_task_list(current_user.id, limit, offset))
+    response.set_etag(etag)
+    response.cache_control.no_cache = True
+    return response
+
+def _tasks_etag(user_id):
+    """Fingerprint of everything /tasks renders for this user"""
+    updated_at, count, nodes = db.session.execute(
+        db.select(db.func.max(Task.updated_at), db.func.count(Task.id),
+                  # Every node column the page shows: status, hostname, address
+                  db.func.group_concat(db.distinct(
+                      Node.id + ':' + Node.status + ':' + Node.hostname + ':' + Node.ip_address)))
+        .outerjoin(Node, Task.assigned_node_id == Node.id)
+        .where(Task.user_id == user_id)
+    ).one()
+    return blake2b(f'{updated_at}|{count}|{nodes}'.encode(), digest_size=8).hexdigest()
+
+def _task_list(user_id, limit, offset):
+    """/tasks payload: one page of the user's tasks, newest first"""
+    # Plain column rows, with the node joined in, instead of hydrated Task objects
+    rows = db.session.execute(
+        db.select(Task.id, Task.original_filename, Task.status, Task.priority,
+                  Task.comsol_version, Task.progress_percentage, Task.current_step,
+                  Task.created_at, Task.execution_time, Task.queue_time,
+                  Task.error_message, Task.result_filename,
+                  Task.assigned_node_id, Task.result_upload_pending,
+                  Node.hostname.label('node_hostname'),
+                  Node.ip_address.label('node_ip_address'),
+                  Node.status.label('node_status'))
+        .outerjoin(Node, Task.assigned_node_id == Node.id)
+        .where(Task.user_id == user_id)
+        .order_by(Task.created_at.desc())
+        .limit(limit).offset(offset)
+    ).all()
     
     task_list = []
-    for task in tasks:
+    for row in rows:
         task_data = {
-            'id': task.id,
-            'original_filename': task.original_filename,
-            'status': task.status,
-            'priority': task.priority,
-            'comsol_version': task.comsol_version,
-            'progress': task.progress_percentage,
-            'current_step': task.current_step,
-            'created_at': task.created_at.isoformat(),
-            'execution_time': task.execution_time,
-            'queue_time': task.queue_time,
-            'error_message': task.error_message
+            'id': row.id,
+            'original_filename': row.original_filename,
+            'status': row.status,
+            'priority': row.priority,
+            'comsol_version': row.comsol_version,
+            'progress': row.progress_percentage,
+            'current_step': row.current_step,
+            'created_at': row.created_at,
+            'execution_time': row.execution_time,
+            'queue_time': row.queue_time,
+            'error_message': row.error_message
         }
         
-        if task.result_filename:
-            task_data['download_url'] = f"/download/{task.id}"
+        if row.result_filename:
+            task_data['download_url'] = f"/download/{row.id}"
 
-        if task.assigned_node_id:
-            n = Node.query.get(task.assigned_node_id)
-            task_data['node'] = {'hostname': n.hostname, 'ip_address': n.ip_address,
-                                 'status': n.status} if n else None
-            task_data['result_upload_pending'] = bool(task.result_upload_pending)
+        if row.assigned_node_id:
+            task_data['node'] = {'hostname': row.node_hostname, 'ip_address': row.node_ip_address,
+                                 'status': row.node_status} if row.node_hostname else None
+            task_data['result_upload_pending'] = bool(row.result_upload_pending)
 
         task_list.append(task_data)
     
-    return jsonify(task_list)
+    return task_list
 
 @app.route('/task/<task_id>/status')
 @login_required
 def get_task_status(task_id):
     """Get detailed status of a specific task"""
-    task = Task.query.filter_by(id=task_id, user_id=current_user.id).first()
+    task = _own_task(task_id)
     
     if not task:
         return jsonify({'error': 'Task not found'}), 404
     
-    # Get Celery task status if available
-    celery_status = None
-    if task.celery_task_id:
-        from tasks import run_comsol_simulation
-        celery_task = run_comsol_simulation.AsyncResult(task.celery_task_id)
-        celery_status = {
-            'state': celery_task.state,
-            'info': celery_task.info
-        }
-    
+    # The worker and the node endpoints keep the Task row up to date, so the
+    # status is served from the database without asking the result backend.
     node_info = None
     if task.assigned_node_id:
         n = Node.query.get(task.assigned_node_id)
@@ -817,7 +717,6 @@ def get_task_status(task_id):
         'status': task.status,
         'progress': task.progress_percentage,
         'current_step': task.current_step,
-        'celery_status': celery_status,
         'error_message': task.error_message,
         'execution_time': task.execution_time,
         'node': node_info,
@@ -828,7 +727,7 @@ def get_task_status(task_id):
 @login_required
 def download_result(task_id):
     """Download result file"""
-    task = Task.query.filter_by(id=task_id, user_id=current_user.id).first()
+    task = _own_task(task_id)
     
     if not task:
         return jsonify({'error': 'Task not found'}), 404
@@ -837,13 +736,12 @@ def download_result(task_id):
     if not task.result_filename and task.assigned_node_id:
         node = Node.query.get(task.assigned_node_id)
         if node:
-            stem = Path(task.unique_filename).stem
             action_id = str(uuid.uuid4())
             node.add_pending_action({
                 'id': action_id,
                 'type': 'reupload',
                 'task_id': task.id,
-                'output_filename': f"{stem}_solved.mph",
+                'output_filename': task.solved_filename,
             })
             task.result_upload_pending = True
             db.session.commit()
@@ -858,213 +756,249 @@ def download_result(task_id):
     if not task.result_filename:
         return jsonify({'error': 'Result file not found'}), 404
 
-    user_folder = current_user.get_user_folder()
-    result_path = Config.RESULTS_FOLDER / user_folder / task.result_filename
+    result_path = task.results_dir / task.result_filename
     if not result_path.exists():
         return jsonify({'error': 'Result file not found on disk'}), 404
     
     # Ensure proper encoding for Chinese characters in download filename
     download_filename = f"solved_{task.original_filename}"
-    return send_file(result_path, as_attachment=True, download_name=download_filename)
+    if Config.RESULTS_ACCEL_REDIRECT:
+        # Behind nginx: send headers only and let nginx serve the file
+        response = app.response_class(mimetype='application/octet-stream')
+        response.headers['X-Accel-Redirect'] = (
+            f"{Config.RESULTS_ACCEL_REDIRECT.rstrip('/')}/{task.user_folder}/{quote(task.result_filename)}")
+        response.headers['Content-Disposition'] = (
+            f"attachment; filename*=UTF-8''{quote(download_filename)}")
+        return response
+    return send_file(result_path, as_attachment=True, download_name=download_filename,
+                     conditional=True, etag=True)
 
 @app.route('/history')
 @login_required
 def history():
     """User task history page"""
-    tasks = Task.query.filter_by(user_id=current_user.id).order_by(Task.created_at.desc()).all()
-    return render_template('history.html', tasks=tasks)
+    page = request.args.get('page', 1, type=int)
+    pagination = (Task.query
+                  .with_entities(Task.id, Task.original_filename, Task.status, Task.priority,
+                                 Task.progress_percentage, Task.created_at, Task.completed_at,
+                                 Task.execution_time, Task.result_filename, Task.error_message,
+                                 Node.hostname.label('node_hostname'))
+                  .outerjoin(Node, Task.assigned_node_id == Node.id)
+                  .filter(Task.user_id == current_user.id)
+                  .order_by(Task.created_at.desc())
+                  .paginate(page=page, per_page=TASKS_PAGE_SIZE, error_out=False))
+    return render_template('history.html', tasks=pagination.items, pagination=pagination)
+
+@dataclass(slots=True)
+class RealTimeStats:
+    """Live numbers shown on the queue page"""
+    pending_tasks: int
+    running_tasks: int
+    completed_tasks_today: int
+    failed_tasks_today: int
+    cpu_usage: float
+    memory_usage: float
+    disk_usage: float
+    avg_queue_time: float
+    avg_execution_time: float
+    timestamp: datetime = field(default_factory=utcnow)
 
 @app.route('/queue')
 @login_required
 def queue_status():
     """Global queue status page"""
-    from datetime import date
-    
-    pending_tasks = Task.query.filter(Task.status == 'pending').order_by(Task.created_at).all()
-    running_tasks = Task.query.filter_by(status='running').order_by(Task.started_at).all()
-    
-    # Calculate real-time statistics
-    today = date.today()
-    completed_today = Task.query.filter(
-        Task.status == 'completed',
-        db.func.date(Task.completed_at) == today
-    ).count()
-    
-    failed_today = Task.query.filter(
-        Task.status == 'failed',
-        db.func.date(Task.completed_at) == today
-    ).count()
-    
-    # Create a stats object with real-time data
-    class RealTimeStats:
-        def __init__(self):
-            self.pending_tasks = len(pending_tasks)
-            self.running_tasks = len(running_tasks)
-            self.completed_tasks_today = completed_today
-            self.failed_tasks_today = failed_today
-            
-            # Get real-time system resource usage
-            try:
-                import psutil
-                self.cpu_usage = psutil.cpu_percent(interval=1)
-                self.memory_usage = psutil.virtual_memory().percent
-                # Use C:\ for Windows, / for Unix
-                disk_path = 'C:\\' if os.name == 'nt' else '/'
-                self.disk_usage = psutil.disk_usage(disk_path).percent
-            except ImportError:
-                # Fallback if psutil is not available
-                self.cpu_usage = 0
-                self.memory_usage = 0
-                self.disk_usage = 0
-            
-            # Calculate average times from recent tasks
-            recent_tasks = Task.query.filter(
-                Task.completed_at >= today,
-                Task.execution_time.isnot(None)
-            ).all()
-            
-            # Safe average calculations
-            self.avg_queue_time = 0
-            self.avg_execution_time = 0
-            
-            if recent_tasks:
-                # Filter out None values for queue_time
-                valid_queue_times = [t.queue_time for t in recent_tasks if t.queue_time is not None]
-                if valid_queue_times:
-                    self.avg_queue_time = sum(valid_queue_times) / len(valid_queue_times)
-                
-                # Filter out None values for execution_time
-                valid_exec_times = [t.execution_time for t in recent_tasks if t.execution_time is not None]
-                if valid_exec_times:
-                    self.avg_execution_time = sum(valid_exec_times) / len(valid_exec_times)
-            self.timestamp = datetime.now(timezone.utc)
+    # Both lists in one query: pending in dispatch order, then running by start time
+    queued = (Task.query.options(selectinload(Task.node), raiseload('*'))
+              .filter(Task.status.in_(['pending', 'running']))
+              .order_by(Task.status,
+                        db.case((Task.status == 'running', Task.started_at)),
+                        *Task.dispatch_order())
+              .all())
+    pending_tasks = [t for t in queued if t.status == 'pending']
+    running_tasks = [t for t in queued if t.status == 'running']
     
-    stats = RealTimeStats()
+    _, _, completed_today, failed_today, avg_queue_time, avg_execution_time = _task_stats()
+    stats = RealTimeStats(
+        pending_tasks=len(pending_tasks),
+        running_tasks=len(running_tasks),
+        completed_tasks_today=completed_today,
+        failed_tasks_today=failed_today,
+        # Latest system resource usage from the background sampler
+        cpu_usage=_resource_usage['cpu'],
+        memory_usage=_resource_usage['memory'],
+        disk_usage=_resource_usage['disk'],
+        avg_queue_time=avg_queue_time,
+        avg_execution_time=avg_execution_time,
+    )
     
     return render_template('queue.html', 
                          pending_tasks=pending_tasks, 
                          running_tasks=running_tasks,
                          stats=stats)
 
-@app.route('/api/stats')
-@login_required
-def api_stats():
-    """API endpoint for system statistics"""
-    from datetime import date
-    
-    # Calculate real-time statistics
-    pending_tasks = Task.query.filter(Task.status == 'pending').count()
-    running_tasks = Task.query.filter_by(status='running').count()
-    
-    # Get today's completed/failed tasks
-    today = date.today()
-    completed_today = Task.query.filter(
-        Task.status == 'completed',
-        db.func.date(Task.completed_at) == today
-    ).count()
-    
-    failed_today = Task.query.filter(
-        Task.status == 'failed',
-        db.func.date(Task.completed_at) == today
-    ).count()
-    
-    # Get real-time system resource usage
-    try:
-        import psutil
-        cpu_usage = psutil.cpu_percent(interval=1)
-        memory_usage = psutil.virtual_memory().percent
-        disk_path = 'C:\\' if os.name == 'nt' else '/'
-        disk_usage = psutil.disk_usage(disk_path).percent
-    except ImportError:
-        cpu_usage = 0
-        memory_usage = 0
-        disk_usage = 0
-    
-    # Calculate average times
-    recent_tasks = Task.query.filter(
-        Task.completed_at >= today,
-        Task.execution_time.isnot(None)
-    ).all()
-    
-    # Safe average calculations
-    avg_queue_time = 0
-    avg_execution_time = 0
-    
-    if recent_tasks:
-        # Filter out None values for queue_time
-        valid_queue_times = [t.queue_time for t in recent_tasks if t.queue_time is not None]
-        if valid_queue_times:
-            avg_queue_time = sum(valid_queue_times) / len(valid_queue_times)
-        
-        # Filter out None values for execution_time
-        valid_exec_times = [t.execution_time for t in recent_tasks if t.execution_time is not None]
-        if valid_exec_times:
-            avg_execution_time = sum(valid_exec_times) / len(valid_exec_times)
+STATS_CACHE_TTL = 2  # seconds; also sent as the response max-age
+
+@_ttl_cache(STATS_CACHE_TTL)
+def _api_stats_payload():
+    """(computed_at, body) for /api/stats; concurrent pollers share one computation"""
+    # Queue counts, today's outcomes and averages in one SQL round trip. Not
+    # through _task_stats(): its own cache would make the body older than the
+    # max-age sent with it, and a MISS here would not mean the SQL ran.
+    (pending_tasks, running_tasks, completed_today, failed_today,
+     avg_queue_time, avg_execution_time) = Task.stats()
     
-    return jsonify({
+    return time.monotonic(), {
         'pending_tasks': pending_tasks,
         'running_tasks': running_tasks,
         'completed_today': completed_today,
         'failed_today': failed_today,
-        'cpu_usage': cpu_usage,
-        'memory_usage': memory_usage,
-        'disk_usage': disk_usage,
+        # Latest system resource usage from the background sampler
+        'cpu_usage': _resource_usage['cpu'],
+        'memory_usage': _resource_usage['memory'],
+        'disk_usage': _resource_usage['disk'],
         'avg_queue_time': avg_queue_time,
         'avg_execution_time': avg_execution_time,
-        'timestamp': datetime.now(timezone.utc).isoformat()
-    })
+        'timestamp': utcnow()
+    }
+
+@app.route('/api/stats')
+@login_required
+def api_stats():
+    """API endpoint for system statistics"""
+    requested_at = time.monotonic()
+    computed_at, payload = _api_stats_payload()
+    response = jsonify(payload)
+    response.headers['X-Cache'] = 'MISS' if computed_at >= requested_at else 'HIT'
+    response.cache_control.private = True
+    response.cache_control.max_age = STATS_CACHE_TTL
+    return response
+
+LOG_MIMETYPE = 'text/plain'
+LOG_SNIFF_BYTES = 64 * 1024
+
+def _text_response(body, charset='utf-8'):
+    """Plain-text response in the same format as a served log file"""
+    return app.response_class(body, content_type=f'{LOG_MIMETYPE}; charset={charset}')
+
+@lru_cache(maxsize=256)
+def _log_charset(path, mtime_ns, size):
+    """Charset of a log file, sniffed from its head. mtime/size are part of the
+    key so a rewritten file is sniffed again."""
+    with open(path, 'rb') as f:
+        head = f.read(LOG_SNIFF_BYTES)
+    try:
+        # UTF-8 first (node logs, UTF-8 consoles); final=False tolerates a
+        # character cut at the end
+        codecs.getincrementaldecoder('utf-8')().decode(head, final=False)
+        return 'utf-8'
+    except UnicodeDecodeError:
+        pass
+    # Local runs keep COMSOL's raw console output, in the system encoding
+    detected = chardet.detect(head)
+    encoding = detected.get('encoding')
+    if not encoding or detected.get('confidence', 0) < 0.7:
+        encoding = locale.getpreferredencoding()
+    if encoding.lower() in ('gb2312', 'gbk'):
+        encoding = 'gb18030'  # superset, so browsers don't mangle rarer characters
+    return encoding
 
 @app.route('/logs/<task_id>')
 @login_required
 def view_logs(task_id):
     """View task logs"""
-    task = Task.query.filter_by(id=task_id, user_id=current_user.id).first()
+    task = _own_task(task_id)
     
     # Node tasks without a saved log file — show status-appropriate message
     if task and task.assigned_node_id and not task.log_filename:
         if task.status == 'pending':
-            return jsonify({'logs': '[Task is pending and waiting to run on a node computer]'})
+            return _text_response('[Task is pending and waiting to run on a node computer]')
         if task.status == 'running':
-            return jsonify({'logs': '[Task is currently running on node computer — logs will be available after completion]'})
+            return _text_response('[Task is currently running on node computer — logs will be available after completion]')
         if task.error_log:
-            return jsonify({'logs': task.error_log})
-        return jsonify({'logs': '[No log was uploaded for this task]'})
+            return _text_response(task.error_log)
+        return _text_response('[No log was uploaded for this task]')
 
     if not task or not task.log_filename:
         return jsonify({'error': 'Log file not found'}), 404
 
-    user_folder = current_user.get_user_folder()
-    log_path = Config.LOGS_FOLDER / user_folder / task.log_filename
+    log_path = task.logs_dir / task.log_filename
     if not log_path.exists():
         return jsonify({'error': 'Log file not found on disk'}), 404
-    
+
+    tail = request.args.get('tail', 0, type=int)
     try:
-        # Try to detect encoding and read log file properly
-        import locale
-        import chardet
-        
-        # First try to detect encoding
-        with open(log_path, 'rb') as f:
-            raw_data = f.read()
-            detected = chardet.detect(raw_data)
-            encoding = detected.get('encoding', 'utf-8')
-        
-        # If detection fails or confidence is low, use system encoding
-        if not encoding or detected.get('confidence', 0) < 0.7:
-            encoding = locale.getpreferredencoding()
-        
-        # Read with detected/system encoding
-        with open(log_path, 'r', encoding=encoding, errors='replace') as f:
-            log_content = f.read()
-        return jsonify({'logs': log_content})
-    except Exception as e:
+        st = log_path.stat()
+        charset = _log_charset(str(log_path), st.st_mtime_ns, st.st_size)
+        if tail > 0 and st.st_size > tail:
+            # Only the last `tail` bytes, starting at the next full line
+            with open(log_path, 'rb') as f:
+                f.seek(-tail, os.SEEK_END)
+                data = f.read()
+            data = data[data.find(b'\n') + 1:]
+            response = _text_response(data, charset)
+            response.headers['X-Log-Truncated'] = str(st.st_size)
+            # Validators tied to the file version and the window size
+            response.set_etag(f'{st.st_mtime_ns:x}-{st.st_size:x}-{tail:x}')
+            response.last_modified = st.st_mtime
+            return response.make_conditional(request)
+        response = send_file(log_path, mimetype=LOG_MIMETYPE, conditional=True, etag=True)
+        response.mimetype_params['charset'] = charset
+        return response
+    except OSError as e:
         return jsonify({'error': f'Failed to read log file: {str(e)}'}), 500
 
+def _kill_process_tree(pid):
+    """Kill a local COMSOL process and all its children with one OS call.
+    Returns False if the process had already exited."""
+    if os.name == 'nt':
+        result = subprocess.run(['taskkill', '/F', '/T', '/PID', str(pid)],
+                                capture_output=True, check=False)
+        return result.returncode == 0
+    try:
+        # The worker starts COMSOL in its own session, so its process group
+        # is exactly the tree. Anything else is killed on its own rather than
+        # risk signalling the group it shares with us.
+        if os.getpgid(pid) == pid:
+            os.killpg(pid, signal.SIGKILL)
+        else:
+            os.kill(pid, signal.SIGKILL)
+    except ProcessLookupError:
+        return False
+    return True
+
+# One background thread for the slow part of cancel/delete (broker revoke,
+# process kill, unlinks), so the request returns after its DB update. Not a
+# Celery task: the worker is busy running the very COMSOL job being stopped.
+_cleanup_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='task-cleanup')
+
+def _stop_and_clean(celery_task_id=None, pid=None, paths=()):
+    """Background job: revoke, kill the local COMSOL tree, then remove files."""
+    # Revoke the Celery reservation so the task won't start if it hasn't yet.
+    # Do NOT use terminate=True — on Windows that sends os.kill() which requires
+    # admin rights and crashes the worker.  The process kill below is sufficient.
+    if celery_task_id:
+        try:
+            _celery.AsyncResult(celery_task_id).revoke(terminate=False)
+        except Exception as e:
+            app.logger.warning('Failed to revoke Celery task %s: %s', celery_task_id, e)
+    if pid:
+        try:
+            _kill_process_tree(pid)
+        except Exception as e:
+            app.logger.warning('Failed to kill COMSOL process %s: %s', pid, e)
+    remove_files(paths)
+
+def _local_pid(task):
+    """PID of the task's COMSOL process if it runs here. A node task's
+    process_id is a PID on the node, which aborts it itself when its next
+    progress report sees the cancellation."""
+    return None if task.assigned_node_id else task.process_id
+
 @app.route('/task/<task_id>/cancel', methods=['POST'])
 @login_required
 def cancel_task(task_id):
     """Cancel a running or pending task"""
-    task = Task.query.filter_by(id=task_id, user_id=current_user.id).first()
+    task = _own_task(task_id)
     
     if not task:
         return jsonify({'error': 'Task not found'}), 404
@@ -1075,37 +1009,15 @@ def cancel_task(task_id):
     try:
         # Mark cancelled FIRST so any concurrent dispatch check sees the correct
         # status immediately (avoids a race where local_running > 0 blocks dispatch).
+        # The node's delete_file action goes out in the same commit.
         task.mark_cancelled()
-
-        # Revoke the Celery reservation so the task won't start if it hasn't yet.
-        # Do NOT use terminate=True — on Windows that sends os.kill() which requires
-        # admin rights and crashes the worker.  The COMSOL process is killed below
-        # via psutil, which is sufficient.
-        if task.celery_task_id:
-            from tasks import run_comsol_simulation
-            celery_task = run_comsol_simulation.AsyncResult(task.celery_task_id)
-            celery_task.revoke(terminate=False)
-
-        # Kill the COMSOL process immediately (synchronously)
-        if task.process_id:
-            try:
-                import psutil
-                parent = psutil.Process(task.process_id)
-                children = parent.children(recursive=True)
-                for child in children:
-                    try:
-                        child.kill()
-                    except psutil.NoSuchProcess:
-                        pass
-                try:
-                    parent.kill()
-                except psutil.NoSuchProcess:
-                    pass
-            except Exception as e:
-                print(f"Warning: Failed to kill COMSOL process {task.process_id}: {e}")
-
-        # Tell the node to delete its local copy of the result file
         _push_node_delete_action(task)
+        cleanup = (task.celery_task_id, _local_pid(task))
+        db.session.commit()
+        _invalidate_counts()
+
+        # Revoke and kill the COMSOL process in the background
+        _cleanup_executor.submit(_stop_and_clean, *cleanup)
 
         # Dispatch any waiting tasks immediately (handles both nodes and local Celery).
         _dispatch_pending_node_tasks()
@@ -1118,11 +1030,59 @@ def cancel_task(task_id):
     except Exception as e:
         return jsonify({'error': f'Failed to cancel task: {str(e)}'}), 500
 
+BULK_CANCEL_LIMIT = 500  # ids per request, well under SQLite's bound-parameter limit
+
+@app.route('/tasks/bulk_cancel', methods=['POST'])
+@login_required
+def bulk_cancel_tasks():
+    """Cancel several of the current user's tasks in one request and commit.
+    Body: {"ids": [...]}; ids that are unknown or not cancellable are skipped."""
+    ids = (request.get_json(silent=True) or {}).get('ids')
+    if not isinstance(ids, list) or not all(isinstance(i, str) for i in ids):
+        return jsonify({'error': 'ids must be a list of task ids'}), 400
+    if len(ids) > BULK_CANCEL_LIMIT:
+        return jsonify({'error': f'At most {BULK_CANCEL_LIMIT} tasks per request'}), 400
+
+    tasks = db.session.execute(db.select(Task).where(
+        Task.id.in_(ids),
+        Task.user_id == current_user.id,
+        Task.status.in_(('pending', 'running')),
+    )).scalars().all()
+
+    try:
+        # One commit for every status change and node action
+        cancelled, cleanups = [], []
+        for task in tasks:
+            task.mark_cancelled()
+            _push_node_delete_action(task)
+            cancelled.append(task.id)
+            cleanups.append((task.celery_task_id, _local_pid(task)))
+        db.session.commit()
+        _invalidate_counts()
+
+        # Revoke and kill the COMSOL processes in the background
+        for cleanup in cleanups:
+            _cleanup_executor.submit(_stop_and_clean, *cleanup)
+
+        if cancelled:
+            _dispatch_pending_node_tasks()
+
+        cancelled_set = set(cancelled)
+        return jsonify({
+            'success': True,
+            'cancelled': cancelled,
+            'skipped': [i for i in ids if i not in cancelled_set],
+        })
+
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'error': f'Failed to cancel tasks: {str(e)}'}), 500
+
 @app.route('/task/<task_id>/requeue', methods=['POST'])
 @login_required
 def requeue_task(task_id):
     """Re-queue a cancelled task so it can be picked up again."""
-    task = Task.query.filter_by(id=task_id, user_id=current_user.id).first()
+    task = _own_task(task_id)
     if not task:
         return jsonify({'error': 'Task not found'}), 404
     if task.status != 'cancelled':
@@ -1136,6 +1096,7 @@ def requeue_task(task_id):
     task.progress_percentage = 0.0
     task.current_step     = None
     db.session.commit()
+    _invalidate_counts()
     _dispatch_pending_node_tasks()
     return jsonify({'success': True})
 
@@ -1144,46 +1105,26 @@ def requeue_task(task_id):
 @login_required
 def delete_task(task_id):
     """Delete a task and its associated files"""
-    task = Task.query.filter_by(id=task_id, user_id=current_user.id).first()
+    task = _own_task(task_id)
     
     if not task:
         return jsonify({'error': 'Task not found'}), 404
     
     try:
         was_active = task.can_be_cancelled()
-
-        # Revoke Celery reservation (no terminate=True — crashes worker on Windows)
-        if task.celery_task_id:
-            from tasks import run_comsol_simulation
-            celery_task = run_comsol_simulation.AsyncResult(task.celery_task_id)
-            celery_task.revoke(terminate=False)
-
-        # Kill the COMSOL OS process and all its children
-        if task.process_id:
-            try:
-                import psutil
-                parent = psutil.Process(task.process_id)
-                for child in parent.children(recursive=True):
-                    try:
-                        child.kill()
-                    except psutil.NoSuchProcess:
-                        pass
-                try:
-                    parent.kill()
-                except psutil.NoSuchProcess:
-                    pass
-            except Exception as e:
-                print(f"Warning: Failed to kill COMSOL process {task.process_id}: {e}")
+        # Read before the row is deleted; the files go after the process is killed
+        cleanup = (task.celery_task_id, _local_pid(task), task.file_paths())
 
         # Tell the node to delete its local copy of the result file
         _push_node_delete_action(task)
 
-        # Clean up server-side files
-        task.cleanup_files()
-
         # Delete task from database
         db.session.delete(task)
         db.session.commit()
+        _invalidate_counts()
+
+        # Revoke, kill the COMSOL process and remove server-side files in the background
+        _cleanup_executor.submit(_stop_and_clean, *cleanup)
         
         if was_active:
             _dispatch_pending_node_tasks()
@@ -1202,7 +1143,6 @@ def delete_task(task_id):
 @admin_required
 def admin_settings():
     """Admin: COMSOL path and CPU core settings"""
-    import multiprocessing
     total_cores = multiprocessing.cpu_count()
 
     if request.method == 'POST':
@@ -1241,10 +1181,13 @@ def change_password():
     
     if form.validate_on_submit():
         try:
-            # Update password
-            current_user.set_password(form.new_password.data)
-            current_user.must_change_password = False
+            # Update password on the real row, not the session proxy
+            user = db.session.get(User, current_user.id)
+            user.set_password(form.new_password.data)
+            user.must_change_password = False
             db.session.commit()
+            _forget_user(user.id)  # other sessions of this user reload
+            _remember_user(user)
 
             flash('密码修改成功！', 'success')
             return redirect(url_for('index'))
@@ -1262,27 +1205,24 @@ def change_password():
 def _push_node_delete_action(task):
     """Queue a delete_file action on the node that owns this task's result.
     Safe to call even when the node is offline — the action persists until
-    the node comes back online and acknowledges it."""
+    the node comes back online and acknowledges it. The caller commits."""
     if not task.assigned_node_id:
         return
     node = Node.query.get(task.assigned_node_id)
     if not node:
         return
-    stem = Path(task.unique_filename).stem
     node.add_pending_action({
         'id': str(uuid.uuid4()),
         'type': 'delete_file',
-        'filename': f"{stem}_solved.mph",
+        'filename': task.solved_filename,
     })
-    db.session.commit()
 
 
 def _save_node_log(task, log_text: str):
     """Write node task output to a log file on the server and set task.log_filename.
     Best-effort — logs errors but never raises."""
     try:
-        user_folder  = task.user.get_user_folder()
-        log_dir      = Config.LOGS_FOLDER / user_folder
+        log_dir      = task.logs_dir
         log_dir.mkdir(parents=True, exist_ok=True)
         stem         = Path(task.unique_filename).stem
         log_filename = f"{stem}.log"
@@ -1301,7 +1241,10 @@ def _node_from_request():
     node_token = request.headers.get('X-Node-Token')
     if not node_id or not node_token:
         return None
-    return Node.query.filter_by(id=node_id, auth_token=node_token).first()
+    node = db.session.get(Node, node_id)
+    if node is None or not secrets.compare_digest(node.auth_token.encode(), node_token.encode()):
+        return None
+    return node
 
 
 @app.route('/api/nodes/register', methods=['POST'])
@@ -1324,7 +1267,6 @@ def node_register():
         node.status          = 'online'
         node.touch()
     else:
-        import secrets
         node = Node(
             hostname=hostname,
             ip_address=ip_address,
@@ -1386,7 +1328,7 @@ def node_task_poll():
     task = Task.query.filter_by(
         assigned_node_id=node.id,
         status='pending'
-    ).order_by(Task.created_at).first()
+    ).order_by(*Task.dispatch_order()).first()
 
     # 2. If none, try to claim an unassigned pending task (pull model)
     if not task and node.status != 'busy':
@@ -1395,7 +1337,7 @@ def node_task_poll():
                 assigned_node_id=None,
                 status='pending',
                 comsol_version=ver,
-            ).order_by(Task.created_at).first()
+            ).order_by(*Task.dispatch_order()).first()
             if candidate:
                 candidate.assigned_node_id = node.id
                 db.session.commit()
@@ -1426,30 +1368,32 @@ def node_download_task_file(task_id):
     if not node:
         return jsonify({'error': 'Unauthorized'}), 401
 
-    task = Task.query.filter_by(id=task_id, assigned_node_id=node.id).first()
+    task = _node_task(task_id, node)
     if not task:
         return jsonify({'error': 'Task not found'}), 404
 
-    user_folder = task.user.get_user_folder()
-    file_path   = Config.UPLOAD_FOLDER / user_folder / task.unique_filename
-    if not file_path.exists():
+    file_path = task.upload_path
+    # Open up front: one open() replaces the exists() + stat() path lookups,
+    # and the size comes from the descriptor we are about to stream.
+    try:
+        fh = open(file_path, 'rb')
+    except FileNotFoundError:
         return jsonify({'error': 'Input file not found'}), 404
+    file_size = os.fstat(fh.fileno()).st_size
 
     # Stream with 4 MB chunks to avoid Werkzeug's 8 KB default block size,
     # which causes Nagle+delayed-ACK stalls on Windows LAN (~200 ms per chunk).
-    file_size = file_path.stat().st_size
     CHUNK = 4 * 1024 * 1024
 
     def _stream():
-        with open(file_path, 'rb') as fh:
+        with fh:
             while True:
                 data = fh.read(CHUNK)
                 if not data:
                     break
                 yield data
 
-    from flask import Response as _Response
-    return _Response(
+    response = Response(
         _stream(),
         headers={
             'Content-Disposition': f'attachment; filename="{task.unique_filename}"',
@@ -1457,6 +1401,9 @@ def node_download_task_file(task_id):
             'Content-Type':        'application/octet-stream',
         }
     )
+    # Close the handle even if the client disconnects before streaming starts
+    response.call_on_close(fh.close)
+    return response
 
 
 @app.route('/api/nodes/task/<task_id>/start', methods=['POST'])
@@ -1466,7 +1413,7 @@ def node_task_start(task_id):
     if not node:
         return jsonify({'error': 'Unauthorized'}), 401
 
-    task = Task.query.filter_by(id=task_id, assigned_node_id=node.id).first()
+    task = _node_task(task_id, node)
     if not task:
         return jsonify({'error': 'Task not found'}), 404
 
@@ -1486,7 +1433,7 @@ def node_task_progress(task_id):
     if not node:
         return jsonify({'error': 'Unauthorized'}), 401
 
-    task = Task.query.filter_by(id=task_id, assigned_node_id=node.id).first()
+    task = _node_task(task_id, node)
     if not task:
         return jsonify({'error': 'Task not found'}), 404
 
@@ -1497,7 +1444,11 @@ def node_task_progress(task_id):
     data       = request.get_json(silent=True) or {}
     percentage = float(data.get('percentage', task.progress_percentage or 0))
     step       = data.get('step')
-    task.update_progress(percentage, step)
+    # Each request loads a fresh row, so gate on what is stored: skip the
+    # write while neither the whole percent nor the step text changes
+    if int(percentage) != int(task.progress_percentage or 0) or (step and step != task.current_step):
+        task.update_progress(percentage, step)
+        db.session.commit()
     return jsonify({'ok': True, 'cancel': False}), 200
 
 
@@ -1506,28 +1457,26 @@ def node_task_complete(task_id):
     """Node marks a task completed and optionally uploads the result file.
 
     The status update and the file upload are intentionally decoupled:
-    mark_completed() is called as soon as the request is authenticated so
-    the task status is always updated even if the file save fails.
+    a failed file save is only logged, so the task status is always updated;
+    it is committed together with the node state and pending actions.
     """
     node = _node_from_request()
     if not node:
         return jsonify({'error': 'Unauthorized'}), 401
 
-    task = Task.query.filter_by(id=task_id, assigned_node_id=node.id).first()
+    task = _node_task(task_id, node)
     if not task:
         return jsonify({'error': 'Task not found'}), 404
 
     # ── 1. Mark the task complete immediately ─────────────────────────────
     result_filename = None
-    stem = Path(task.unique_filename).stem
-    expected_result = f"{stem}_solved.mph"
+    expected_result = task.solved_filename
 
     # ── 2. Try to save the result file (best-effort, never blocks status) ──
     if 'result_file' in request.files:
         result_file = request.files['result_file']
         try:
-            user_folder = task.user.get_user_folder()
-            result_dir  = Config.RESULTS_FOLDER / user_folder
+            result_dir  = task.results_dir
             result_dir.mkdir(parents=True, exist_ok=True)
             result_path = result_dir / expected_result
             result_file.save(str(result_path))
@@ -1541,7 +1490,7 @@ def node_task_complete(task_id):
     if log_text:
         _save_node_log(task, log_text)
 
-    task.mark_completed(result_filename)   # commits status = 'completed'
+    task.mark_completed(result_filename)
     node.status          = 'online'
     node.current_task_id = None
 
@@ -1554,10 +1503,10 @@ def node_task_complete(task_id):
         })
 
     db.session.commit()
+    _invalidate_counts()
 
     try:
-        from tasks import update_system_stats
-        update_system_stats.delay()
+        _celery.send_task('tasks.update_system_stats')
     except Exception:
         pass
 
@@ -1577,7 +1526,7 @@ def node_upload_result(task_id):
     if not node:
         return jsonify({'error': 'Unauthorized'}), 401
 
-    task = Task.query.filter_by(id=task_id, assigned_node_id=node.id).first()
+    task = _node_task(task_id, node)
     if not task:
         return jsonify({'error': 'Task not found'}), 404
 
@@ -1586,11 +1535,9 @@ def node_upload_result(task_id):
 
     result_file = request.files['result_file']
     try:
-        user_folder     = task.user.get_user_folder()
-        result_dir      = Config.RESULTS_FOLDER / user_folder
+        result_dir      = task.results_dir
         result_dir.mkdir(parents=True, exist_ok=True)
-        stem            = Path(task.unique_filename).stem
-        result_filename = f"{stem}_solved.mph"
+        result_filename = task.solved_filename
         result_path     = result_dir / result_filename
         result_file.save(str(result_path))
         task.result_filename      = result_filename
@@ -1617,7 +1564,7 @@ def node_task_fail(task_id):
     if not node:
         return jsonify({'error': 'Unauthorized'}), 401
 
-    task = Task.query.filter_by(id=task_id, assigned_node_id=node.id).first()
+    task = _node_task(task_id, node)
     if not task:
         return jsonify({'error': 'Task not found'}), 404
 
@@ -1627,16 +1574,16 @@ def node_task_fail(task_id):
     log_text      = data.get('log_text') or error_log
     if log_text:
         _save_node_log(task, log_text)
-    task.mark_failed(error_message, error_log)   # commits status = 'failed'
+    task.mark_failed(error_message, error_log)
     node.status          = 'online'
     node.current_task_id = None
 
     # If the file landed on the server, tell the node it can delete its copy
     db.session.commit()
+    _invalidate_counts()
 
     try:
-        from tasks import update_system_stats
-        update_system_stats.delay()
+        _celery.send_task('tasks.update_system_stats')
     except Exception:
         pass
 
@@ -1657,7 +1604,7 @@ def node_upload_log(task_id):
         return jsonify({'error': 'Unauthorized'}), 401
 
     # Accept any task still assigned to this node regardless of status
-    task = Task.query.filter_by(id=task_id, assigned_node_id=node.id).first()
+    task = _node_task(task_id, node)
     if not task:
         return jsonify({'error': 'Task not found'}), 404
 
@@ -1727,7 +1674,7 @@ def _dispatch_pending_node_tasks():
     waiting = Task.query.filter(
         Task.status == 'pending',
         Task.assigned_node_id.is_(None),
-    ).order_by(Task.created_at).all()
+    ).order_by(*Task.dispatch_order()).all()
 
     if not waiting:
         return
@@ -1741,9 +1688,7 @@ def _dispatch_pending_node_tasks():
             if task.comsol_version in node.comsol_versions:
                 if task.celery_task_id:
                     try:
-                        from tasks import run_comsol_simulation
-                        run_comsol_simulation.AsyncResult(
-                            task.celery_task_id).revoke()
+                        _celery.AsyncResult(task.celery_task_id).revoke()
                         task.celery_task_id = None
                     except Exception:
                         pass
@@ -1763,21 +1708,15 @@ def _dispatch_pending_node_tasks():
         if local_running > 0:
             continue
 
-        upload_path = (Config.UPLOAD_FOLDER
-                       / task.user.get_user_folder()
-                       / task.unique_filename)
-        result_name = Path(task.unique_filename).stem + '_solved.mph'
-        result_path = (Config.RESULTS_FOLDER
-                       / task.user.get_user_folder()
-                       / result_name)
-        result_path.parent.mkdir(parents=True, exist_ok=True)
+        upload_path = task.upload_path
+        result_path = task.results_dir / task.solved_filename
 
         if task.celery_task_id:
             # Already pending in Celery — don't double-submit
             continue
 
-        from tasks import run_comsol_simulation
-        celery_task = run_comsol_simulation.apply_async(
+        celery_task = _celery.send_task(
+            'tasks.run_comsol_simulation',
             args=[task.id, str(upload_path), str(result_path)],
             queue=Config.HIGH_PRIORITY_QUEUE if task.priority == 'high'
                   else Config.NORMAL_PRIORITY_QUEUE,
@@ -1790,7 +1729,11 @@ def _dispatch_pending_node_tasks():
 
 def _dispatch_task(task, upload_path, result_path):
     """Assign task to an online node that supports the required COMSOL version,
-    falling back to the local Celery worker if none are available."""
+    falling back to the local Celery worker if none are available.
+
+    The task (which may not be in the database yet) is committed together with
+    its assignment in one transaction."""
+    task_id = task.id
     comsol_ver = task.comsol_version
 
     # Find an idle node that supports this COMSOL version
@@ -1804,20 +1747,31 @@ def _dispatch_task(task, upload_path, result_path):
     if chosen:
         # Assign to node — it will poll and pick it up
         task.assigned_node_id = chosen.id
+        info = {'mode': 'node', 'node_id': chosen.id, 'node_hostname': chosen.hostname}
         db.session.commit()
         # No Celery task needed; node polls /api/nodes/task/poll
-        return {'mode': 'node', 'node_id': chosen.id, 'node_hostname': chosen.hostname}
+        return info
     else:
-        # Fall back to local Celery worker
-        from tasks import run_comsol_simulation
-        celery_task = run_comsol_simulation.apply_async(
-            args=[task.id, str(upload_path), str(result_path)],
-            queue=Config.HIGH_PRIORITY_QUEUE if task.priority == 'high'
-                  else Config.NORMAL_PRIORITY_QUEUE
-        )
-        task.celery_task_id = celery_task.id
+        # Fall back to local Celery worker. The message id is chosen up front
+        # and committed with the row, so the worker always finds it recorded.
+        celery_task_id = uuid7()
+        task.celery_task_id = celery_task_id
+        queue = (Config.HIGH_PRIORITY_QUEUE if task.priority == 'high'
+                 else Config.NORMAL_PRIORITY_QUEUE)
         db.session.commit()
-        return {'mode': 'local', 'celery_task_id': celery_task.id}
+        try:
+            _celery.send_task(
+                'tasks.run_comsol_simulation',
+                args=[task_id, str(upload_path), str(result_path)],
+                queue=queue,
+                task_id=celery_task_id,
+            )
+        except Exception:
+            # Nothing was queued: leave the task for the pending dispatcher
+            task.celery_task_id = None
+            db.session.commit()
+            raise
+        return {'mode': 'local', 'celery_task_id': celery_task_id}
 
 
 # ---------------------------------------------------------------------------
@@ -1844,12 +1798,8 @@ def _repend_tasks_for_offline_nodes(node_ids: list):
 
 def _start_heartbeat_monitor(flask_app):
     """Background thread: mark nodes offline if last_seen > 60 s ago."""
-    import threading
-    from datetime import timedelta, datetime as _datetime
-
     def _monitor():
         while True:
-            import time
             time.sleep(30)
             try:
                 with flask_app.app_context():
@@ -1857,7 +1807,7 @@ def _start_heartbeat_monitor(flask_app):
                     # naive-datetime storage (timezone-aware datetimes produce
                     # strings with +00:00 that compare incorrectly against
                     # the plain YYYY-MM-DD HH:MM:SS values stored on disk).
-                    cutoff = _datetime.utcnow() - timedelta(seconds=60)
+                    cutoff = datetime.utcnow() - timedelta(seconds=60)
                     stale = Node.query.filter(
                         Node.status != 'offline',
                         Node.last_seen < cutoff
@@ -1878,6 +1828,57 @@ def _start_heartbeat_monitor(flask_app):
     t.start()
 
 
+RESOURCE_SAMPLE_INTERVAL = 2  # seconds
+
+# Latest host usage in percent, kept current by the resource sampler thread
+_resource_usage = {'cpu': 0, 'memory': 0, 'disk': 0}
+_resource_sampler_lock = threading.Lock()
+_resource_sampler_started = False
+
+def _start_resource_sampler():
+    """Background thread: sample CPU/memory/disk so views never block on psutil.
+    Used by both the web app and the Celery worker; only the first call in a
+    process starts the thread."""
+    global _resource_sampler_started
+    if psutil is None:
+        return  # usage stays at 0 when psutil is not available
+    with _resource_sampler_lock:
+        if _resource_sampler_started:
+            return
+        _resource_sampler_started = True
+
+    # The volume the results are written to (any drive on Windows)
+    disk_path = str(Config.RESULTS_FOLDER)
+    # Memory and disk are current-state readings: take them now, not one tick later
+    try:
+        _resource_usage['memory'] = psutil.virtual_memory().percent
+        _resource_usage['disk'] = psutil.disk_usage(disk_path).percent
+    except Exception:
+        pass
+
+    def _sample():
+        psutil.cpu_percent(interval=None)  # prime: the first reading is meaningless
+        next_tick = time.monotonic()
+        while True:
+            # Fixed monotonic cadence, so slow iterations don't drift the schedule
+            # and cpu_percent() is never called less than an interval apart
+            next_tick += RESOURCE_SAMPLE_INTERVAL
+            time.sleep(max(0.0, next_tick - time.monotonic()))
+            try:
+                # Non-blocking: CPU usage since the previous tick
+                _resource_usage['cpu'] = psutil.cpu_percent(interval=None)
+                _resource_usage['memory'] = psutil.virtual_memory().percent
+                _resource_usage['disk'] = psutil.disk_usage(disk_path).percent
+            except Exception:
+                # Never crash the sampler thread
+                pass
+            if time.monotonic() - next_tick > RESOURCE_SAMPLE_INTERVAL:
+                next_tick = time.monotonic()  # fell behind (e.g. suspend): resync
+
+    t = threading.Thread(target=_sample, name='resource-sampler', daemon=True)
+    t.start()
+
+
 # Start monitor after first request context is available.
 # We use a flag so it only fires once even in debug reload mode.
 _monitor_started = False
@@ -1888,9 +1889,9 @@ def _ensure_monitor_running():
     if not _monitor_started:
         _monitor_started = True
         _start_heartbeat_monitor(app)
+        _start_resource_sampler()
 
 
 if __name__ == '__main__':
-    import os as _os
-    debug = _os.environ.get('FLASK_DEBUG', 'false').lower() in ('1', 'true', 'yes')
+    debug = os.environ.get('FLASK_DEBUG', 'false').lower() in ('1', 'true', 'yes')
     app.run(debug=debug, host='0.0.0.0', port=5000)
\ No newline at end of file
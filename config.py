@@ -1,6 +1,11 @@
 import os
+import threading
 from pathlib import Path
 
+# User folders this process has already created (or found) under every base
+_ensured_user_dirs = set()
+_ensured_user_dirs_lock = threading.Lock()
+
 class Config:
     # Base directory
     BASE_DIR = Path(__file__).parent.absolute()
@@ -17,27 +22,54 @@ class Config:
             RuntimeWarning,
             stacklevel=2,
         )
+
+    # Werkzeug hash method for new passwords. scrypt (OpenSSL) costs about
+    # half of Werkzeug's default 600k-round PBKDF2 per hash. Existing hashes
+    # keep verifying and are upgraded on the next successful login.
+    PASSWORD_HASH_METHOD = os.environ.get('PASSWORD_HASH_METHOD') or 'scrypt'
     
     # Database configuration
     SQLALCHEMY_DATABASE_URI = f"sqlite:///{BASE_DIR / 'database.db'}"
     SQLALCHEMY_TRACK_MODIFICATIONS = False
+    # Room for every distinct statement the app issues, so none are recompiled
+    # after being evicted from SQLAlchemy's LRU (default size 500)
+    SQLALCHEMY_ENGINE_OPTIONS = {'query_cache_size': 1200}
     
     # Celery configuration
     CELERY_BROKER_URL = os.environ.get('CELERY_BROKER_URL') or 'pyamqp://guest@localhost//'
     CELERY_RESULT_BACKEND = os.environ.get('CELERY_RESULT_BACKEND') or 'rpc://'
-    CELERY_TASK_SERIALIZER = 'json'
-    CELERY_RESULT_SERIALIZER = 'json'
-    CELERY_ACCEPT_CONTENT = ['json']
+    # msgpack packs task args and PROGRESS meta smaller and faster than json;
+    # json stays accepted so messages queued before the switch still run
+    CELERY_TASK_SERIALIZER = 'msgpack'
+    CELERY_RESULT_SERIALIZER = 'msgpack'
+    CELERY_ACCEPT_CONTENT = ['msgpack', 'json']
     CELERY_TIMEZONE = 'Asia/Shanghai'  # Keep using old-style setting name
     BROKER_CONNECTION_RETRY_ON_STARTUP = True  # Using old-style setting name
     CELERY_IMPORTS = ('tasks',)   # Add this
+    # COMSOL® runs are long and the worker runs one at a time: reserve only the
+    # message being executed so later high-priority work is not stuck behind
+    # prefetched normal-priority messages.
+    CELERYD_PREFETCH_MULTIPLIER = 1  # old-style name for worker_prefetch_multiplier
     
     # File upload configuration
     UPLOAD_FOLDER = BASE_DIR / 'uploads'
     RESULTS_FOLDER = BASE_DIR / 'results'
     LOGS_FOLDER = BASE_DIR / 'logs'
+    # Every base that holds a user_<id> subfolder
+    USER_FOLDER_BASES = (UPLOAD_FOLDER, RESULTS_FOLDER, LOGS_FOLDER)
+    JINJA_CACHE_FOLDER = BASE_DIR / '.jinja_cache'  # compiled template bytecode
     MAX_CONTENT_LENGTH = 100 * 1024 * 1024  # 100MB max file size
-    ALLOWED_EXTENSIONS = {'mph'}
+    ALLOWED_EXTENSIONS = frozenset({'mph'})
+
+    # Download configuration
+    # Set to an nginx `internal` location that maps onto RESULTS_FOLDER
+    # (e.g. /protected-results) to hand result downloads to nginx via
+    # X-Accel-Redirect instead of streaming the bytes through Python.
+    RESULTS_ACCEL_REDIRECT = os.environ.get('RESULTS_ACCEL_REDIRECT')
+    # Behind Apache/lighttpd with mod_xsendfile instead, enable this so every
+    # send_file() response carries an X-Sendfile header and the front end
+    # streams the file from disk itself.
+    USE_X_SENDFILE = os.environ.get('USE_X_SENDFILE', 'false').lower() in ('1', 'true', 'yes')
     
     # COMSOL® configuration
     COMSOL_VERSIONS = {
@@ -61,6 +93,11 @@ class Config:
     MAX_CONCURRENT_TASKS = int(os.environ.get('MAX_CONCURRENT_TASKS', 2))
     HIGH_PRIORITY_QUEUE = 'high_priority'
     NORMAL_PRIORITY_QUEUE = 'normal_priority'
+    # Pool for start_worker.py. Local COMSOL® runs go one at a time, so the
+    # pool holds a single process that lives for the whole worker: 'prefork'
+    # starts it once at boot, 'solo' runs tasks in the worker process itself
+    # and 'gevent' needs the gevent package.
+    WORKER_POOL = os.environ.get('WORKER_POOL') or 'prefork'
     
     # Monitoring configuration
     PROGRESS_UPDATE_INTERVAL = 5  # seconds
@@ -69,5 +106,23 @@ class Config:
     @staticmethod
     def init_app(app):
         # Create directories if they don't exist
-        for folder in [Config.UPLOAD_FOLDER, Config.RESULTS_FOLDER, Config.LOGS_FOLDER]:
+        for folder in (*Config.USER_FOLDER_BASES, Config.JINJA_CACHE_FOLDER):
             folder.mkdir(exist_ok=True)
+
+    @staticmethod
+    def ensure_user_dirs(user_folder):
+        """Create uploads/results/logs subfolders for a user, once per process"""
+        if user_folder in _ensured_user_dirs:
+            return
+        with _ensured_user_dirs_lock:
+            if user_folder in _ensured_user_dirs:
+                return
+            for base_folder in Config.USER_FOLDER_BASES:
+                (base_folder / user_folder).mkdir(parents=True, exist_ok=True)
+            _ensured_user_dirs.add(user_folder)
+
+    @staticmethod
+    def forget_user_dirs(user_folder):
+        """Drop a user from the ensured set after their folders are removed"""
+        with _ensured_user_dirs_lock:
+            _ensured_user_dirs.discard(user_folder)
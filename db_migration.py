@@ -13,6 +13,11 @@ def _column_exists(cursor, table, column):
     return any(row[1] == column for row in cursor.fetchall())
 
 
+def _index_exists(cursor, name):
+    cursor.execute("SELECT 1 FROM sqlite_master WHERE type='index' AND name=?", (name,))
+    return cursor.fetchone() is not None
+
+
 def migrate_database():
     """Apply all pending schema migrations"""
     db_path = Path(__file__).parent / 'database.db'
@@ -121,6 +126,40 @@ def migrate_database():
         else:
             print("'result_upload_pending' already exists, skipping")
 
+        # Migration 11: composite indexes for the task list and queue queries
+        for name, ddl in (
+            ('ix_tasks_user_created',
+             "CREATE INDEX ix_tasks_user_created ON tasks (user_id, created_at DESC)"),
+            ('ix_tasks_status_created',
+             "CREATE INDEX ix_tasks_status_created ON tasks (status, created_at)"),
+        ):
+            if not _index_exists(cursor, name):
+                cursor.execute(ddl)
+                print(f"Created index '{name}' on tasks table")
+            else:
+                print(f"'{name}' already exists, skipping")
+
+        # Migration 12: add updated_at to tasks (drives the /tasks ETag)
+        if not _column_exists(cursor, 'tasks', 'updated_at'):
+            cursor.execute("ALTER TABLE tasks ADD COLUMN updated_at DATETIME")
+            cursor.execute("UPDATE tasks SET updated_at = COALESCE(completed_at, started_at, created_at)")
+            print("Added 'updated_at' column to tasks table")
+        else:
+            print("'updated_at' already exists, skipping")
+
+        # Migration 13: indexes for the daily statistics and per-user status filters
+        for name, ddl in (
+            ('ix_tasks_status_completed',
+             "CREATE INDEX ix_tasks_status_completed ON tasks (status, completed_at)"),
+            ('ix_tasks_user_status',
+             "CREATE INDEX ix_tasks_user_status ON tasks (user_id, status)"),
+        ):
+            if not _index_exists(cursor, name):
+                cursor.execute(ddl)
+                print(f"Created index '{name}' on tasks table")
+            else:
+                print(f"'{name}' already exists, skipping")
+
         conn.commit()
         print("Migration complete.")
 
@@ -4,6 +4,10 @@ from wtforms.validators import DataRequired, Length, ValidationError, EqualTo
 from models import User
 from config import Config
 
+# Built once and shared by every form instance
+COMSOL_VERSION_CHOICES = tuple((version, info['name']) for version, info in Config.COMSOL_VERSIONS.items())
+PRIORITY_CHOICES = (('normal', '普通优先级'), ('high', '高优先级'))
+
 class LoginForm(FlaskForm):
     username = StringField('用户名', validators=[DataRequired(), Length(min=3, max=20)])
     password = PasswordField('密码', validators=[DataRequired()])
@@ -38,10 +42,10 @@ class ChangePasswordForm(FlaskForm):
 
 class UploadForm(FlaskForm):
     comsol_version = SelectField('COMSOL版本', 
-                                choices=[(version, info['name']) for version, info in Config.COMSOL_VERSIONS.items()],
+                                choices=COMSOL_VERSION_CHOICES,
                                 default=Config.DEFAULT_COMSOL_VERSION,
                                 validators=[DataRequired()])
     priority = SelectField('任务优先级',
-                          choices=[('normal', '普通优先级'), ('high', '高优先级')],
+                          choices=PRIORITY_CHOICES,
                           default='normal',
                           validators=[DataRequired()])
@@ -1,22 +1,64 @@
 import json
 import logging
 import os
+import sqlite3
+import time
 import uuid
-from datetime import datetime, timezone
+from datetime import date, datetime, timezone
+from functools import cached_property, lru_cache
 from pathlib import Path
 
 from flask_login import UserMixin
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
 from werkzeug.security import generate_password_hash, check_password_hash
 
+from config import Config
+
 logger = logging.getLogger(__name__)
 db = SQLAlchemy()
 
+# WAL lets the web process read while the worker writes, and with
+# synchronous=NORMAL a commit no longer waits for an fsync (WAL stays durable
+# across application crashes; only an OS crash can lose the last commits).
+SQLITE_PRAGMAS = (
+    ('journal_mode', 'WAL'),
+    ('synchronous', 'NORMAL'),
+    ('temp_store', 'MEMORY'),
+    ('mmap_size', 256 * 1024 * 1024),
+    ('cache_size', -64 * 1024),   # negative = KiB, i.e. 64 MB per connection
+)
+
+
+@event.listens_for(Engine, 'connect')
+def _set_sqlite_pragmas(dbapi_connection, connection_record):
+    """Apply SQLITE_PRAGMAS to every new SQLite connection."""
+    if not isinstance(dbapi_connection, sqlite3.Connection):
+        return
+    cursor = dbapi_connection.cursor()
+    for name, value in SQLITE_PRAGMAS:
+        cursor.execute(f"PRAGMA {name}={value}")
+    cursor.close()
+
 
 def utcnow():
     return datetime.now(timezone.utc)
 
 
+def uuid7():
+    """Time-ordered UUID (RFC 9562 version 7) in the usual 36-char form.
+
+    The leading 48 bits are the Unix time in ms, so new rows append to the
+    right-hand edge of the primary-key index instead of random pages.
+    """
+    rand = int.from_bytes(os.urandom(10), 'big')
+    value = ((time.time_ns() // 1_000_000) << 80
+             | 0x7 << 76 | (rand >> 68) << 64       # version, 12 random bits
+             | 0b10 << 62 | rand & ((1 << 62) - 1))  # variant, 62 random bits
+    return str(uuid.UUID(int=value))
+
+
 def _ensure_aware(dt):
     """Return dt as a timezone-aware datetime (UTC).
     SQLite stores naive datetimes; this prevents subtraction errors."""
@@ -27,26 +69,32 @@ def _ensure_aware(dt):
     return dt
 
 
-def _remove_file(path):
-    """Remove a file, logging a warning on failure instead of raising."""
-    try:
-        os.remove(path)
-    except Exception as exc:
-        logger.warning("Failed to delete %s: %s", path, exc)
+RESULT_SIDECAR_SUFFIXES = ('', '.recovery', '.status')
 
+# Progress within the same whole percent is recorded at most this often (s)
+PROGRESS_WRITE_INTERVAL = 2
 
-def _remove_with_sidecars(base_path):
-    """Remove a file and its .recovery / .status sidecars if they exist."""
-    _remove_file(base_path)
-    for suffix in ('.recovery', '.status'):
-        sidecar = Path(str(base_path) + suffix)
-        if sidecar.exists():
-            _remove_file(sidecar)
+
+def remove_files(paths):
+    """Remove each file if present, logging a warning on failure instead of raising."""
+    # unlink(missing_ok=True) instead of an exists() check per path
+    for path in paths:
+        try:
+            path.unlink(missing_ok=True)
+        except OSError as exc:
+            logger.warning("Failed to delete %s: %s", path, exc)
+
+@lru_cache(maxsize=None)
+def _hash_method_prefix(method):
+    """The "method:params" part Werkzeug stores for hashes made with method.
+    A bare name stands for its current defaults (scrypt -> scrypt:32768:8:1),
+    so it is taken from a real hash, made once per process."""
+    return generate_password_hash('', method=method).split('$', 1)[0]
 
 class User(UserMixin, db.Model):
     __tablename__ = 'users'
     
-    id = db.Column(db.String(36), primary_key=True, default=lambda: str(uuid.uuid4()))
+    id = db.Column(db.String(36), primary_key=True, default=uuid7)
     username = db.Column(db.String(80), unique=True, nullable=False)
     password_hash = db.Column(db.String(255), nullable=False)
     is_admin = db.Column(db.Boolean, default=False, nullable=False)
@@ -60,15 +108,31 @@ class User(UserMixin, db.Model):
     
     def set_password(self, password):
         """Set password hash"""
-        self.password_hash = generate_password_hash(password)
+        self.password_hash = generate_password_hash(password, method=Config.PASSWORD_HASH_METHOD)
     
     def check_password(self, password):
         """Check password against hash"""
         return check_password_hash(self.password_hash, password)
+
+    def needs_rehash(self):
+        """True if the stored hash was made with a method or parameters other
+        than the configured ones"""
+        return self.password_hash.split('$', 1)[0] != _hash_method_prefix(Config.PASSWORD_HASH_METHOD)
     
+    @staticmethod
+    def folder_for(user_id):
+        """User-specific folder name for a user id, without loading the row"""
+        return f"user_{user_id}"
+
+    @cached_property
+    def user_folder(self):
+        """User-specific folder name (UUID-based, stable across username changes).
+        Formatted once per instance; the id never changes after insert."""
+        return User.folder_for(self.id)
+
     def get_user_folder(self):
         """Get user-specific folder path (UUID-based, stable across username changes)"""
-        return f"user_{self.id}"
+        return self.user_folder
     
     def is_administrator(self):
         """Check if user is admin"""
@@ -91,7 +155,7 @@ class User(UserMixin, db.Model):
 class Task(db.Model):
     __tablename__ = 'tasks'
     
-    id = db.Column(db.String(36), primary_key=True, default=lambda: str(uuid.uuid4()))
+    id = db.Column(db.String(36), primary_key=True, default=uuid7)
     user_id = db.Column(db.String(36), db.ForeignKey('users.id'), nullable=False)
     
     # File information
@@ -108,6 +172,7 @@ class Task(db.Model):
     created_at = db.Column(db.DateTime, default=utcnow)
     started_at = db.Column(db.DateTime)
     completed_at = db.Column(db.DateTime)
+    updated_at = db.Column(db.DateTime, default=utcnow, onupdate=utcnow)  # any change to the row
     
     # Progress and results
     progress_percentage = db.Column(db.Float, default=0.0)
@@ -130,10 +195,56 @@ class Task(db.Model):
 
     # Node distribution — null means local Celery worker
     assigned_node_id = db.Column(db.String(36), db.ForeignKey('nodes.id'), nullable=True)
+
+    # Indexes for the per-user task lists, the status-filtered queue views and
+    # the "finished today" statistics (keep in sync with db_migration.py)
+    __table_args__ = (
+        db.Index('ix_tasks_user_created', user_id, created_at.desc()),
+        db.Index('ix_tasks_status_created', status, created_at),
+        db.Index('ix_tasks_status_completed', status, completed_at),
+        db.Index('ix_tasks_user_status', user_id, status),
+    )
     
     def __repr__(self):
         return f'<Task {self.id}: {self.original_filename}>'
     
+    @classmethod
+    def set_state(cls, task_id, **values):
+        """UPDATE one task by primary key without loading it or going through
+        the unit of work (updated_at still bumps via onupdate). Loaded
+        instances are not refreshed until the caller's commit expires them.
+        Returns the number of rows changed."""
+        return db.session.execute(
+            db.update(cls).where(cls.id == task_id).values(**values),
+            execution_options={'synchronize_session': False},
+        ).rowcount
+
+    @classmethod
+    def dispatch_order(cls):
+        """ORDER BY clauses for pending work: high priority first, then oldest first"""
+        return (db.case((cls.priority == 'high', 0), else_=1), cls.created_at)
+
+    @classmethod
+    def stats(cls):
+        """(pending, running, completed_today, failed_today, avg_queue_time,
+        avg_execution_time) in a single statement"""
+        today = date.today()
+        finished_today = db.func.date(cls.completed_at) == today
+        timed = cls.execution_time.isnot(None)
+        # Today's outcomes and averages only need rows finished since midnight
+        today_agg = db.select(
+            db.func.count(db.case((db.and_(cls.status == 'completed', finished_today), 1))),
+            db.func.count(db.case((db.and_(cls.status == 'failed', finished_today), 1))),
+            db.func.avg(db.case((timed, cls.queue_time))),
+            db.func.avg(db.case((timed, cls.execution_time))),
+        ).where(cls.completed_at >= today).subquery()
+        pending, running, completed, failed, avg_queue, avg_exec = db.session.execute(db.select(
+            db.select(db.func.count(cls.id)).where(cls.status == 'pending').scalar_subquery(),
+            db.select(db.func.count(cls.id)).where(cls.status == 'running').scalar_subquery(),
+            today_agg,
+        )).one()
+        return pending, running, completed, failed, avg_queue or 0, avg_exec or 0
+    
     @property
     def is_active(self):
         return self.status in ['pending', 'running']
@@ -141,19 +252,53 @@ class Task(db.Model):
     @property
     def is_completed(self):
         return self.status in ['completed', 'failed']
+
+    # File locations derive from user_id and the stored file names, so none
+    # of them loads the owning User row.
+
+    @cached_property
+    def user_folder(self):
+        return User.folder_for(self.user_id)
+
+    @property
+    def solved_filename(self):
+        """Name of COMSOL's output for this task: {stem}_solved.mph"""
+        return f"{Path(self.unique_filename).stem}_solved.mph"
+
+    @property
+    def upload_path(self):
+        return Config.UPLOAD_FOLDER / self.user_folder / self.unique_filename
+
+    @property
+    def results_dir(self):
+        return Config.RESULTS_FOLDER / self.user_folder
+
+    @property
+    def logs_dir(self):
+        return Config.LOGS_FOLDER / self.user_folder
     
+    # The state transitions below only change attributes; the caller commits
+    # them together with whatever else it updates in the same request.
+
     def update_progress(self, percentage, step=None):
+        """Record progress. Returns False, changing nothing, while the
+        percentage stays in the whole-percent bucket this instance last
+        recorded and that was under PROGRESS_WRITE_INTERVAL seconds ago."""
+        bucket, now = int(percentage), time.monotonic()
+        last = getattr(self, '_last_progress', None)  # (bucket, monotonic), not a column
+        if last and last[0] == bucket and now - last[1] < PROGRESS_WRITE_INTERVAL:
+            return False
+        self._last_progress = (bucket, now)
         self.progress_percentage = percentage
         if step:
             self.current_step = step
-        db.session.commit()
+        return True
     
     def mark_started(self):
         self.status = 'running'
         self.started_at = utcnow()
         if self.created_at:
             self.queue_time = (self.started_at - _ensure_aware(self.created_at)).total_seconds()
-        db.session.commit()
     
     def mark_completed(self, result_filename=None):
         self.status = 'completed'
@@ -163,7 +308,6 @@ class Task(db.Model):
             self.result_filename = result_filename
         if self.started_at:
             self.execution_time = (self.completed_at - _ensure_aware(self.started_at)).total_seconds()
-        db.session.commit()
     
     def mark_failed(self, error_message=None, error_log=None):
         self.status = 'failed'
@@ -174,7 +318,6 @@ class Task(db.Model):
             self.error_log = error_log
         if self.started_at:
             self.execution_time = (self.completed_at - _ensure_aware(self.started_at)).total_seconds()
-        db.session.commit()
     
     def mark_cancelled(self):
         """Mark task as cancelled"""
@@ -182,48 +325,39 @@ class Task(db.Model):
         self.completed_at = utcnow()
         if self.started_at:
             self.execution_time = (self.completed_at - _ensure_aware(self.started_at)).total_seconds()
-        db.session.commit()
     
     def can_be_cancelled(self):
         """Check if task can be cancelled"""
         return self.status in ['pending', 'running']
     
-    def cleanup_files(self):
-        """Clean up associated files when task is deleted"""
-        from config import Config
-
-        user_folder = self.user.get_user_folder()
-
-        # Upload file
+    def file_paths(self):
+        """Server-side files that belong to this task (existing or not)"""
+        candidates = []
         if self.unique_filename:
-            upload_path = Config.UPLOAD_FOLDER / user_folder / self.unique_filename
-            if upload_path.exists():
-                _remove_file(upload_path)
-
-        # Result file and sidecars
+            candidates.append(self.upload_path)
+        # Result file, plus the derived {stem}_solved.mph for failed tasks,
+        # each with its .recovery / .status sidecars
+        results = []
         if self.result_filename:
-            result_path = Config.RESULTS_FOLDER / user_folder / self.result_filename
-            if result_path.exists():
-                _remove_with_sidecars(result_path)
-
-        # Derived result path for failed tasks: {stem}_solved.mph
+            results.append(self.result_filename)
         if self.unique_filename:
-            stem = Path(self.unique_filename).stem
-            derived_path = Config.RESULTS_FOLDER / user_folder / f"{stem}_solved.mph"
-            if derived_path.exists():
-                _remove_with_sidecars(derived_path)
-
-        # Log file
+            results.append(self.solved_filename)
+        for name in dict.fromkeys(results):
+            result_path = self.results_dir / name
+            candidates.extend(Path(f"{result_path}{suffix}") for suffix in RESULT_SIDECAR_SUFFIXES)
         if self.log_filename:
-            log_path = Config.LOGS_FOLDER / user_folder / self.log_filename
-            if log_path.exists():
-                _remove_file(log_path)
+            candidates.append(self.logs_dir / self.log_filename)
+        return candidates
+
+    def cleanup_files(self):
+        """Clean up associated files when task is deleted"""
+        remove_files(self.file_paths())
 
 class Node(db.Model):
     """A registered node computer that can execute simulation tasks."""
     __tablename__ = 'nodes'
 
-    id           = db.Column(db.String(36), primary_key=True, default=lambda: str(uuid.uuid4()))
+    id           = db.Column(db.String(36), primary_key=True, default=uuid7)
     hostname     = db.Column(db.String(255), nullable=False)
     ip_address   = db.Column(db.String(45),  nullable=False)
     auth_token   = db.Column(db.String(64),  nullable=False, unique=True)
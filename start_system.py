@@ -4,13 +4,25 @@ COMSOL Local Server Starter
 Runs Flask app and Celery worker in sequence with proper environment detection
 """
 
+import json
 import os
+import queue
 import sys
+import socket
 import subprocess
 import time
 import threading
+from functools import lru_cache
 from pathlib import Path
 
+FLASK_ADDRESS = ('127.0.0.1', 5000)
+
+# `conda env list` takes seconds to start, so its answer is kept on disk and
+# reused while conda's own registry of environments is unchanged
+CONDA_ENVS_CACHE = Path(os.environ.get('XDG_CACHE_HOME') or Path.home() / '.cache') / 'cmsl' / 'conda_envs.json'
+CONDA_ENVS_REGISTRY = Path.home() / '.conda' / 'environments.txt'
+
+@lru_cache(maxsize=None)
 def check_conda_available():
     """Check if conda is available in the system"""
     try:
@@ -20,8 +32,38 @@ def check_conda_available():
     except (subprocess.TimeoutExpired, FileNotFoundError):
         return False
 
+def _registry_mtime():
+    try:
+        return CONDA_ENVS_REGISTRY.stat().st_mtime_ns
+    except OSError:
+        return None
+
+def _load_cached_environments(registry_mtime):
+    try:
+        cached = json.loads(CONDA_ENVS_CACHE.read_text(encoding='utf-8'))
+    except (OSError, ValueError):
+        return None
+    if cached.get('registry_mtime') != registry_mtime:
+        return None
+    return cached.get('envs')
+
+def _store_cached_environments(registry_mtime, envs):
+    tmp_path = CONDA_ENVS_CACHE.with_suffix('.tmp')
+    try:
+        CONDA_ENVS_CACHE.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path.write_text(json.dumps({'registry_mtime': registry_mtime, 'envs': envs}),
+                            encoding='utf-8')
+        os.replace(tmp_path, CONDA_ENVS_CACHE)
+    except OSError:
+        pass
+
 def get_conda_environments():
     """Get list of available conda environments"""
+    registry_mtime = _registry_mtime()
+    if registry_mtime is not None:
+        envs = _load_cached_environments(registry_mtime)
+        if envs is not None:
+            return envs
     try:
         result = subprocess.run(['conda', 'env', 'list'], 
                               capture_output=True, text=True, timeout=10)
@@ -34,11 +76,50 @@ def get_conda_environments():
                         env_name = parts[0]
                         if env_name != 'base':  # Skip base environment
                             envs.append(env_name)
+            if registry_mtime is not None:
+                _store_cached_environments(registry_mtime, envs)
             return envs
     except (subprocess.TimeoutExpired, FileNotFoundError):
         pass
     return []
 
+def wait_until_ready(process, probe, timeout):
+    """Poll probe(remaining) with exponential backoff until it succeeds. The
+    probe gets the seconds left before the deadline and must not outlast them.
+
+    Returns True once ready, False if the process exited and None on timeout.
+    """
+    deadline = time.time() + timeout
+    delay = 0.05
+    while True:
+        if process.poll() is not None:
+            return False
+        if probe(max(0.1, deadline - time.time())):
+            return True
+        remaining = deadline - time.time()
+        if remaining <= 0:
+            return None
+        time.sleep(min(delay, remaining))
+        delay = min(delay * 2, 1.6)
+
+def flask_listening(remaining):
+    """Check whether the Flask server accepts TCP connections"""
+    try:
+        with socket.create_connection(FLASK_ADDRESS, timeout=min(0.5, remaining)):
+            return True
+    except OSError:
+        return False
+
+def celery_responds(python_cmd, remaining):
+    """Check whether the worker started on this host answers a ping"""
+    try:
+        result = subprocess.run([python_cmd, 'start_worker.py', '--ping'],
+                              cwd=Path(__file__).parent,
+                              capture_output=True, text=True, timeout=remaining)
+        return result.returncode == 0
+    except (subprocess.TimeoutExpired, FileNotFoundError):
+        return False
+
 def run_flask_app(python_cmd):
     """Run the Flask application"""
     print("🚀 Starting Flask Web Server...")
@@ -50,22 +131,15 @@ def run_flask_app(python_cmd):
                                  universal_newlines=True,
                                  bufsize=1)
         
-        # Monitor Flask startup
-        startup_timeout = 30
-        start_time = time.time()
-        
-        while True:
-            if process.poll() is not None:
-                print("❌ Flask app exited unexpectedly")
-                return None
-                
-            if time.time() - start_time > startup_timeout:
-                print("⚠️  Flask startup timeout, but continuing...")
-                break
-                
-            time.sleep(1)
-            
-        print("✅ Flask Web Server started successfully")
+        # Wait until Flask accepts connections
+        ready = wait_until_ready(process, flask_listening, timeout=30)
+        if ready is False:
+            print("❌ Flask app exited unexpectedly")
+            return None
+        if ready is None:
+            print("⚠️  Flask startup timeout, but continuing...")
+        else:
+            print("✅ Flask Web Server started successfully")
         print("   Access at: http://localhost:5000")
         return process
         
@@ -84,22 +158,15 @@ def run_celery_worker(python_cmd):
                                  universal_newlines=True,
                                  bufsize=1)
         
-        # Monitor Celery startup
-        startup_timeout = 20
-        start_time = time.time()
-        
-        while True:
-            if process.poll() is not None:
-                print("❌ Celery worker exited unexpectedly")
-                return None
-                
-            if time.time() - start_time > startup_timeout:
-                print("⚠️  Celery startup timeout, but continuing...")
-                break
-                
-            time.sleep(1)
-            
-        print("✅ Celery Worker started successfully")
+        # Wait until the worker answers a ping
+        ready = wait_until_ready(process, lambda remaining: celery_responds(python_cmd, remaining), timeout=20)
+        if ready is False:
+            print("❌ Celery worker exited unexpectedly")
+            return None
+        if ready is None:
+            print("⚠️  Celery startup timeout, but continuing...")
+        else:
+            print("✅ Celery Worker started successfully")
         return process
         
     except Exception as e:
@@ -110,17 +177,23 @@ def monitor_processes(flask_process, celery_process):
     """Monitor both processes and restart if needed"""
     print("\n📊 Monitoring processes... Press Ctrl+C to stop")
     
+    # One waiter thread per child blocks in the OS wait (waitpid /
+    # WaitForSingleObject) and reports the exit as soon as it happens
+    exits = queue.Queue()
+    for name, process in (('Flask', flask_process), ('Celery', celery_process)):
+        if process:
+            threading.Thread(target=lambda n=name, p=process: exits.put((n, p.wait())),
+                             daemon=True).start()
+    
     try:
         while True:
-            # Check Flask process
-            if flask_process and flask_process.poll() is not None:
-                print("⚠️  Flask process stopped unexpectedly")
-                
-            # Check Celery process  
-            if celery_process and celery_process.poll() is not None:
-                print("⚠️  Celery process stopped unexpectedly")
-                
-            time.sleep(5)
+            # The timeout only keeps Ctrl+C responsive on Windows, where a
+            # blocking queue get cannot be interrupted
+            try:
+                name, returncode = exits.get(timeout=1)
+            except queue.Empty:
+                continue
+            print(f"⚠️  {name} process stopped unexpectedly (exit code {returncode})")
             
     except KeyboardInterrupt:
         print("\n🛑 Shutting down processes...")
@@ -203,9 +276,6 @@ def main():
         print("❌ Failed to start Flask app, exiting")
         sys.exit(1)
     
-    # Wait a bit for Flask to fully start
-    time.sleep(3)
-    
     # Start Celery worker
     celery_process = run_celery_worker(python_cmd)
     if not celery_process:
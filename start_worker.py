@@ -7,11 +7,13 @@ Run this script in a separate terminal/command prompt while the Flask app is run
 
 Usage:
     python start_worker.py
+    python start_worker.py --ping   # exit status 0 once this host's worker answers
 
 The worker will process tasks from both high_priority and normal_priority queues.
 """
 
 import os
+import socket
 import sys
 from pathlib import Path
 
@@ -26,15 +28,37 @@ sys.path.insert(0, str(project_dir))
 from dotenv import load_dotenv
 load_dotenv()
 
-# Import Celery app
-from tasks import celery
-import tasks  # Ensure task registration
+from config import Config
+
+# Name the worker explicitly so --ping asks this worker, not any on the broker
+WORKER_NODENAME = f'celery@{socket.gethostname()}'
+
+def ping_worker(timeout=1.0):
+    """True if this host's worker answers a ping. Uses a bare client on the
+    broker config (as app.py does) rather than importing the tasks module,
+    which would build the whole Flask app."""
+    from celery import Celery
+    client = Celery(set_as_current=False, config_source=Config)
+    try:
+        with client.connection_for_write() as connection:
+            # One attempt: the caller polls, so an unreachable broker is just "no"
+            connection.ensure_connection(max_retries=1)
+            return bool(client.control.ping([WORKER_NODENAME], timeout=timeout,
+                                            connection=connection))
+    except Exception:
+        return False
+
+def main():
+    """Start the worker on both priority queues"""
+    # Import Celery app
+    from tasks import celery
+    import tasks  # Ensure task registration
 
-if __name__ == '__main__':
     print("Starting COMSOL Celery Worker...")
     print(f"Project Directory: {project_dir}")
     print(f"Broker URL: {os.environ.get('CELERY_BROKER_URL', 'pyamqp://guest@localhost//')}")
     print(f"Result Backend: {os.environ.get('CELERY_RESULT_BACKEND', 'rpc://')}")
+    print(f"Pool: {Config.WORKER_POOL}")
     print("\nWorker will process tasks from queues: high_priority, normal_priority")
     print("Press Ctrl+C to stop the worker\n")
     
@@ -44,5 +68,12 @@ if __name__ == '__main__':
         '--loglevel=info',
         '--queues=high_priority,normal_priority',
         '--concurrency=1',  # Process one task at a time
+        f'--pool={Config.WORKER_POOL}',
+        f'--hostname={WORKER_NODENAME}',
         '--include=tasks'
     ])
+
+if __name__ == '__main__':
+    if sys.argv[1:] == ['--ping']:
+        sys.exit(0 if ping_worker() else 1)
+    main()
@@ -89,19 +89,24 @@ function handleFileUpload(e) {
     const fileInput = document.getElementById('fileInput');
     if (!fileInput || !fileInput.files[0]) return;
 
-    const filename = fileInput.files[0].name;
+    const file = fileInput.files[0];
 
-    // Snapshot the form data synchronously before resetting
-    const formData = new FormData(form);
+    // Snapshot the form fields synchronously before resetting; the file itself
+    // is sent as the raw request body so the server can stream it to disk.
+    const fields = new URLSearchParams();
+    for (const [key, value] of new FormData(form)) {
+        if (typeof value === 'string') fields.append(key, value);
+    }
 
     // Reset form immediately so the user can queue another upload without waiting
     form.reset();
     resetFileLabel();
 
-    startUpload(formData, filename);
+    startUpload(file, fields);
 }
 
-function startUpload(formData, filename) {
+function startUpload(file, fields) {
+    const filename = file.name;
     const uid = ++_uploadSeq;
 
     // ── progress card inside the upload form panel ──
@@ -173,8 +178,10 @@ function startUpload(formData, filename) {
         _finishUpload(uid, false, isZh() ? '网络错误' : 'Network error');
     });
 
-    xhr.open('POST', '/upload');
-    xhr.send(formData);
+    xhr.open('POST', `/upload?${fields}`);
+    xhr.setRequestHeader('Content-Type', 'application/octet-stream');
+    xhr.setRequestHeader('X-Filename', encodeURIComponent(filename));
+    xhr.send(file);
 }
 
 function _setUploadProgress(uid, pct) {
@@ -416,14 +423,24 @@ function escHtml(s) {
 
 // ─── Task actions ─────────────────────────────────────────────────────────────
 
+const LOG_TAIL_BYTES = 256 * 1024;
+
 async function viewLogs(taskId) {
     try {
-        const resp   = await fetch(`/logs/${taskId}`);
-        const result = await resp.json();
+        // Logs come back as text/plain; errors as JSON. Only the tail is
+        // fetched — the full file stays available at /logs/<id>.
+        const resp = await fetch(`/logs/${taskId}?tail=${LOG_TAIL_BYTES}`);
         if (resp.ok) {
-            document.getElementById('logContent').textContent = result.logs;
+            let text = await resp.text();
+            if (resp.headers.has('X-Log-Truncated')) {
+                const kb = Math.round(LOG_TAIL_BYTES / 1024);
+                text = (isZh() ? `[仅显示最后 ${kb} KB，完整日志: /logs/${taskId}]\n`
+                               : `[Showing the last ${kb} KB — full log: /logs/${taskId}]\n`) + text;
+            }
+            document.getElementById('logContent').textContent = text;
             new bootstrap.Modal(document.getElementById('logModal')).show();
         } else {
+            const result = await resp.json().catch(() => ({ error: `HTTP ${resp.status}` }));
             showToast('error', (isZh() ? '无法加载日志: ' : 'Failed to load logs: ') + result.error);
         }
     } catch (err) {
@@ -1,12 +1,21 @@
+import locale
 import os
 import re
 import subprocess
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timezone
 from pathlib import Path
 from celery.app import Celery
+from celery.signals import worker_process_init
 from models import db, Task, SystemStats, ServerConfig
 from config import Config
-from app import app  # Import the Flask app
+# The Flask app is created once per worker process, at import; each task only
+# pushes an app context (whose teardown also removes the task's DB session)
+from app import (app, _dispatch_pending_node_tasks, _kill_process_tree,
+                 _resource_usage, _start_resource_sampler)
 
 # Initialize Celery
 celery = Celery()
@@ -15,24 +24,58 @@ celery = Celery()
 celery.conf.update(
     CELERY_RESULT_BACKEND='rpc://',
     CELERY_TASK_IGNORE_RESULT=False,
-    CELERY_TASK_SERIALIZER='json',
-    CELERY_ACCEPT_CONTENT=['json'],
-    CELERY_RESULT_SERIALIZER='json',
+    CELERY_TASK_SERIALIZER='msgpack',
+    CELERY_ACCEPT_CONTENT=['msgpack', 'json'],
+    CELERY_RESULT_SERIALIZER='msgpack',
     CELERYD_HIJACK_ROOT_LOGGER=False
 )
 
 # Load the rest of the configuration
 celery.config_from_object('config.Config')
 
+@worker_process_init.connect
+def _reset_db_connections(**kwargs):
+    """Everything else is imported once, before the pool starts, and reused
+    by the pool process for every task. The database connections a forked
+    child inherits are the exception: forget them without closing the
+    parent's, so the child opens its own."""
+    with app.app_context():
+        db.engine.dispose(close=False)
+
 class ProgressParser:
     """Parse COMSOL® progress output to extract percentage and current step"""
-    
-    @staticmethod
-    def parse_progress_line(line):
+
+    # Compiled once; these run on every output line and over the whole output
+    # Pattern for progress percentage: "当前进度: XX % - Step description"
+    _PROGRESS_PATTERN = r'当前进度:\s*(\d+)\s*%\s*-\s*(.+)'
+    _progress_re = re.compile(_PROGRESS_PATTERN)
+    # Tried in order: the first pattern that matches anywhere names the error.
+    # Each is (start, rest): the start always lies within one line, only the
+    # rest (whitespace, then the message) may run on into the next lines.
+    _ERROR_PATTERNS = (
+        (r'错误(?::|：)', r'\s*(.+)'),
+        (r'Error(?::|：)', r'\s*(.+)'),
+        (r'失败(?::|：)', r'\s*(.+)'),
+        (r'Failed(?::|：)', r'\s*(.+)'),
+        (r'/\*+错误\*+/', ''),  # Error block markers like /*****错误********/
+        (r'以下特征遇到问题(?::|：)', ''),  # "The following features encountered problems:"
+        (r'未定义.*所需的材料属性', ''),  # "Required material property ... is not defined"
+    )
+    _error_patterns = [re.compile(start + rest, re.IGNORECASE) for start, rest in _ERROR_PATTERNS]
+    # Any marker will do, so they share one alternation and one pass
+    _ERROR_MARKER_PATTERN = '|'.join((
+        r'/\*+错误\*+/',  # Error block markers
+        '以下特征遇到问题',  # "The following features encountered problems"
+        r'未定义.*所需的材料属性',  # Material property errors
+        'ERROR',
+        'FAILED',
+    ))
+    _error_marker_re = re.compile(_ERROR_MARKER_PATTERN, re.IGNORECASE)
+
+    @classmethod
+    def parse_progress_line(cls, line):
         """Extract progress percentage and step from COMSOL® output line"""
-        # Pattern for progress percentage: "当前进度: XX % - Step description"
-        progress_pattern = r'当前进度:\s*(\d+)\s*%\s*-\s*(.+)'
-        match = re.search(progress_pattern, line)
+        match = cls._progress_re.search(line)
         
         if match:
             percentage = float(match.group(1))
@@ -45,41 +88,195 @@ class ProgressParser:
         
         return None, None
     
-    @staticmethod
-    def parse_error(output):
+    @classmethod
+    def parse_error(cls, output):
         """Extract error information from COMSOL® output"""
-        error_patterns = [
-            r'错误[:：]\s*(.+)',
-            r'Error[:：]\s*(.+)',
-            r'失败[:：]\s*(.+)',
-            r'Failed[:：]\s*(.+)',
-            r'/\*+错误\*+/',  # Error block markers like /*****错误********/
-            r'以下特征遇到问题[:：]',  # "The following features encountered problems:"
-            r'未定义.*所需的材料属性',  # "Required material property ... is not defined"
-        ]
-        
-        for pattern in error_patterns:
-            match = re.search(pattern, output, re.IGNORECASE)
+        for pattern in cls._error_patterns:
+            match = pattern.search(output)
             if match:
-                return match.group(1).strip() if match.groups() else "COMSOL® simulation error detected"
+                return cls.error_message(match)
         
         return None
-    
+
     @staticmethod
-    def has_error_markers(output):
-        """Check if output contains COMSOL® error markers"""
-        error_markers = [
-            r'/\*+错误\*+/',  # Error block markers
-            '以下特征遇到问题',  # "The following features encountered problems"
-            r'未定义.*所需的材料属性',  # Material property errors
-            'ERROR',
-            'FAILED'
-        ]
-        
-        for marker in error_markers:
-            if re.search(marker, output, re.IGNORECASE):
-                return True
-        return False
+    def error_message(match):
+        """The message an error pattern match names"""
+        return match.group(1).strip() if match.groups() else "COMSOL® simulation error detected"
+
+class RawOutputParser:
+    """ProgressParser on the COMSOL® output bytes of one run, which are never
+    decoded as a whole. The patterns are encoded in the output's encoding
+    instead, so only the step text of a progress line is decoded.
+
+    scan_line() sees every line once. One fused search tells whether the line
+    holds an error marker or the start of a parse_error pattern; only then are
+    the individual patterns tried, to flag the markers and remember the log
+    offset of the first line each pattern can match from. scan_errors() then
+    reads back only a window from there instead of the whole log."""
+
+    # Output bytes are only split on b'\n' and stripped, which is safe for the
+    # ASCII-compatible encodings locale.getpreferredencoding() reports
+    # (GBK/GB18030 and UTF-8 trail bytes are never ASCII whitespace or \n).
+
+    def __init__(self, encoding):
+        self.encoding = encoding
+        # Characters the encoding cannot represent cannot occur in its output
+        # either; as character references they simply never match
+        encode = lambda text: text.encode(encoding, 'xmlcharrefreplace')
+        self._progress_re = re.compile(encode(ProgressParser._PROGRESS_PATTERN))
+        self._error_marker_re = re.compile(encode(ProgressParser._ERROR_MARKER_PATTERN), re.IGNORECASE)
+        self._error_starts = [re.compile(encode(start), re.IGNORECASE)
+                              for start, _ in ProgressParser._ERROR_PATTERNS]
+        self._error_line_re = re.compile(b'|'.join(
+            [self._error_marker_re.pattern] + [p.pattern for p in self._error_starts]
+        ), re.IGNORECASE)
+        self._done = encode('完成')
+        self.error_markers_seen = False
+        self._error_offsets = {}  # index into ProgressParser._error_patterns -> log offset
+
+    def parse_progress_line(self, line):
+        """ProgressParser.parse_progress_line for one line of output bytes"""
+        match = self._progress_re.search(line)
+        if match:
+            return float(match.group(1)), match.group(2).strip().decode(self.encoding, 'replace')
+        if self._done in line and b'100' in line:
+            return 100.0, '完成'
+        return None, None
+
+    def scan_line(self, offset, line):
+        """Note error markers and error pattern starts in one line of output
+        bytes, found at offset in the log"""
+        if self._error_line_re.search(line) is None:
+            return
+        if not self.error_markers_seen:
+            self.error_markers_seen = self._error_marker_re.search(line) is not None
+        for index, start in enumerate(self._error_starts):
+            if index not in self._error_offsets and start.search(line):
+                self._error_offsets[index] = offset
+
+    def scan_errors(self, log_file_path, output_tail):
+        """What ProgressParser.parse_error reports for the whole log. No match
+        can begin before the first line its pattern starts on, so only
+        ERROR_SCAN_WINDOW bytes from there are read back for the first pattern
+        that started at all; should its match not fit in them, the whole log
+        is parsed after all."""
+        if not self._error_offsets:
+            return None
+        index = min(self._error_offsets)
+        try:
+            with open(log_file_path, 'rb') as log_file:
+                log_file.seek(self._error_offsets[index])
+                window = log_file.read(ERROR_SCAN_WINDOW)
+        except OSError:
+            return ProgressParser.parse_error(output_tail)
+        if len(window) == ERROR_SCAN_WINDOW:
+            # Do not match against a line cut short by the window
+            window = window[:window.rfind(b'\n') + 1]
+        match = ProgressParser._error_patterns[index].search(window.decode(self.encoding, 'replace'))
+        if match:
+            return ProgressParser.error_message(match)
+        return _parse_log_error(log_file_path, output_tail, self.encoding)
+
+LOG_FLUSH_INTERVAL = 1.0  # seconds
+OUTPUT_READ_SIZE = 64 * 1024  # bytes of COMSOL® output taken per read
+OUTPUT_TAIL_LINES = 2000  # output kept in memory and stored as a task's error_log
+ERROR_SCAN_WINDOW = 64 * 1024  # log bytes read back to name a run's error
+# PROGRESS state is published to the broker only for a new whole percent, and
+# at most this often (seconds)
+STATE_UPDATE_INTERVAL = 0.5
+
+def _parse_log_error(log_file_path, output_tail, encoding):
+    """parse_error over the whole run, read back from the log file (the tail
+    only if the log cannot be read)"""
+    try:
+        output = Path(log_file_path).read_bytes().decode(encoding, 'replace')
+    except OSError:
+        output = output_tail
+    return ProgressParser.parse_error(output)
+
+def _output_lines(stream, log_file):
+    """Yield (offset, stripped line) for each line of a binary output stream,
+    writing each chunk to log_file as it is read, so offset is where the line
+    starts in the log. read1 returns whatever the pipe holds (blocking only
+    while it is empty) and b'' once the writer closes it."""
+    offset, partial_line = 0, b''
+    while chunk := stream.read1(OUTPUT_READ_SIZE):
+        log_file.write(chunk)
+        lines = (partial_line + chunk).split(b'\n')
+        partial_line = lines.pop()
+        for line in lines:
+            yield offset, line.strip()
+            offset += len(line) + 1
+    if partial_line:
+        yield offset, partial_line.strip()
+
+class ThrottledProgressState:
+    """Celery PROGRESS state for a running task. Each publish is a broker round
+    trip, so it goes out at most once per new whole percent and per
+    STATE_UPDATE_INTERVAL. An advance that comes in sooner is held, not
+    dropped: the next poll() after the interval publishes it, and flush()
+    makes sure the last one is always sent."""
+
+    def __init__(self, celery_task):
+        self._celery_task = celery_task
+        self._sent_percent, self._sent_at = -1, 0.0
+        self._pending = None  # (percentage, step) not yet published
+
+    def update(self, percentage, step):
+        if int(percentage) > self._sent_percent:
+            self._pending = (percentage, step)
+        self.poll()
+
+    def poll(self):
+        if self._pending and time.monotonic() - self._sent_at >= STATE_UPDATE_INTERVAL:
+            self.flush()
+
+    def flush(self):
+        if self._pending is None:
+            return
+        percentage, step = self._pending
+        self._celery_task.update_state(
+            state='PROGRESS',
+            meta={
+                'current': percentage,
+                'total': 100,
+                'status': step or 'Processing...'
+            }
+        )
+        self._sent_percent, self._sent_at = int(percentage), time.monotonic()
+        self._pending = None
+
+class TimedFlushLog:
+    """Binary log flushed by a timer thread instead of after every write: a
+    chatty COMSOL run costs one write() per interval, and /logs readers still
+    see output within LOG_FLUSH_INTERVAL seconds even when COMSOL goes quiet."""
+
+    def __init__(self, path):
+        self._file = open(path, 'wb')
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._flusher = threading.Thread(target=self._flush_periodically, daemon=True)
+        self._flusher.start()
+
+    def _flush_periodically(self):
+        while not self._stop.wait(LOG_FLUSH_INTERVAL):
+            with self._lock:
+                self._file.flush()  # no syscall when nothing is buffered
+
+    def write(self, data):
+        with self._lock:
+            self._file.write(data)
+
+    def close(self):
+        self._stop.set()
+        self._flusher.join()
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
 
 @celery.task(bind=True, time_limit=Config.TASK_TIMEOUT, soft_time_limit=Config.TASK_TIMEOUT - 60)
 def run_comsol_simulation(self, task_id, input_file_path, output_file_path):
@@ -92,9 +289,6 @@ def run_comsol_simulation(self, task_id, input_file_path, output_file_path):
         output_file_path: Path for output .mph file
     """
     
-    from app import create_app
-    app = create_app()
-    
     with app.app_context():
         # Get task from database
         task = Task.query.get(task_id)
@@ -113,16 +307,15 @@ def run_comsol_simulation(self, task_id, input_file_path, output_file_path):
             Task.id != task_id,
         ).count()
         if other_running > 0:
-            task.status = 'pending'
-            task.celery_task_id = None
+            Task.set_state(task_id, status='pending', celery_task_id=None)
             db.session.commit()
             return f"Another local task is already running; task {task_id} re-queued"
 
         try:
-            # Mark task as started
+            # Mark task as started; committed below together with the log
+            # file name, in one transaction
             task.mark_started()
             task.celery_task_id = self.request.id
-            db.session.commit()
             
             # Get COMSOL executable: prefer admin-configured DB path, fall back to Config default
             version_key = f'comsol_path_{task.comsol_version}'
@@ -150,63 +343,65 @@ def run_comsol_simulation(self, task_id, input_file_path, output_file_path):
                 '-outputfile', str(output_file_path)
             ]
             
-            # Create user-specific log file path
-            user_folder = task.user.get_user_folder()
-            user_logs_path = Config.LOGS_FOLDER / user_folder
-            user_logs_path.mkdir(parents=True, exist_ok=True)
+            # Create the user's folders (results for COMSOL's output, logs below)
+            # and the log file path
+            Config.ensure_user_dirs(task.user_folder)
+            user_logs_path = task.logs_dir
             log_file_path = user_logs_path / f"{task.unique_filename}_{datetime.now(timezone.utc).strftime('%Y%m%d_%H%M%S')}.log"
             task.log_filename = log_file_path.name
             db.session.commit()
             
-            # Start COMSOL® process with proper encoding for Chinese characters on Windows
-            import locale
+            # COMSOL® writes in the system encoding (usually GBK on Chinese
+            # Windows). Its output is read as bytes: the log keeps them as
+            # they are (/logs detects the charset) and only progress steps
+            # and the stored tail are decoded.
             system_encoding = locale.getpreferredencoding()
-            # Use system encoding (usually GBK on Chinese Windows) for COMSOL output
+            output_parser = RawOutputParser(system_encoding)
             process = subprocess.Popen(
                 comsol_cmd,
                 stdout=subprocess.PIPE,
                 stderr=subprocess.STDOUT,
-                universal_newlines=True,
-                bufsize=1,
-                encoding=system_encoding,
-                errors='replace'
+                # Own session/process group so cancel can kill the whole tree
+                # at once (ignored on Windows, where taskkill /T is used)
+                start_new_session=True,
             )
             
             # Store process ID in task for cancellation
-            task.process_id = process.pid
+            Task.set_state(task_id, process_id=process.pid)
             db.session.commit()
             
-            # Monitor progress
-            output_lines = []
+            # Monitor progress. Only the last OUTPUT_TAIL_LINES stay in
+            # memory; the log file is the full record.
+            output_tail = deque(maxlen=OUTPUT_TAIL_LINES)
             last_progress = 0.0
+            progress_state = ThrottledProgressState(self)
             
-            with open(log_file_path, 'w', encoding='utf-8') as log_file:
-                for line in process.stdout:
-                    line = line.strip()
-                    output_lines.append(line)
-                    log_file.write(line + '\n')
-                    log_file.flush()
+            with TimedFlushLog(log_file_path) as log_file:
+                for offset, line in _output_lines(process.stdout, log_file):
+                    output_tail.append(line)
+
+                    # No marker spans lines, so checking each line as it arrives
+                    # matches scanning the joined output at the end
+                    output_parser.scan_line(offset, line)
                     
                     # Parse progress
-                    percentage, step = ProgressParser.parse_progress_line(line)
-                    if percentage is not None:
-                        if percentage > last_progress:
-                            task.update_progress(percentage, step)
-                            last_progress = percentage
-                            
-                            # Update Celery task state
-                            self.update_state(
-                                state='PROGRESS',
-                                meta={
-                                    'current': percentage,
-                                    'total': 100,
-                                    'status': step or 'Processing...'
-                                }
-                            )
+                    percentage, step = output_parser.parse_progress_line(line)
+                    if percentage is not None and percentage > last_progress:
+                        if task.update_progress(percentage, step):
+                            db.session.commit()
+                        last_progress = percentage
+                        
+                        # Update Celery task state
+                        progress_state.update(percentage, step)
+                    else:
+                        # Any output line gives a held advance its chance to go out
+                        progress_state.poll()
+            # Whatever advance is still held is published before the outcome
+            progress_state.flush()
             
             # Wait for process to complete
             return_code = process.wait()
-            full_output = '\n'.join(output_lines)
+            tail_output = b'\n'.join(output_tail).decode(system_encoding, 'replace')
 
             # Re-read status — cancel_task may have marked it cancelled while
             # COMSOL was running and then killed the process (return code 15).
@@ -216,14 +411,16 @@ def run_comsol_simulation(self, task_id, input_file_path, output_file_path):
 
             if return_code == 0:
                 # Check for COMSOL® errors even if return code is 0
-                if ProgressParser.has_error_markers(full_output):
-                    error_msg = ProgressParser.parse_error(full_output) or "COMSOL® simulation completed with errors"
-                    task.mark_failed(error_msg, full_output)
+                if output_parser.error_markers_seen:
+                    error_msg = output_parser.scan_errors(log_file_path, tail_output) or "COMSOL® simulation completed with errors"
+                    task.mark_failed(error_msg, tail_output)
+                    db.session.commit()
                     raise Exception(error_msg)
                 
                 # Success - no errors detected
                 if os.path.exists(output_file_path):
                     task.mark_completed(Path(output_file_path).name)
+                    db.session.commit()
                     # Update system statistics after task completion
                     try:
                         update_system_stats.delay()
@@ -232,7 +429,6 @@ def run_comsol_simulation(self, task_id, input_file_path, output_file_path):
                         
                     # Dispatch any remaining pending tasks
                     try:
-                        from app import _dispatch_pending_node_tasks
                         _dispatch_pending_node_tasks()
                     except Exception:
                         pass
@@ -246,12 +442,14 @@ def run_comsol_simulation(self, task_id, input_file_path, output_file_path):
                 else:
                     # Process succeeded but no output file
                     error_msg = "COMSOL® process completed but no output file was generated"
-                    task.mark_failed(error_msg, full_output)
+                    task.mark_failed(error_msg, tail_output)
+                    db.session.commit()
                     raise Exception(error_msg)
             else:
                 # Process failed
-                error_msg = ProgressParser.parse_error(full_output) or f"COMSOL® process failed with return code {return_code}"
-                task.mark_failed(error_msg, full_output)
+                error_msg = output_parser.scan_errors(log_file_path, tail_output) or f"COMSOL® process failed with return code {return_code}"
+                task.mark_failed(error_msg, tail_output)
+                db.session.commit()
                 # Update system statistics after task failure
                 try:
                     update_system_stats.delay()
@@ -260,7 +458,6 @@ def run_comsol_simulation(self, task_id, input_file_path, output_file_path):
                     
                 # Dispatch any remaining pending tasks
                 try:
-                    from app import _dispatch_pending_node_tasks
                     _dispatch_pending_node_tasks()
                 except Exception:
                     pass
@@ -274,10 +471,10 @@ def run_comsol_simulation(self, task_id, input_file_path, output_file_path):
                 db.session.refresh(task)
                 if task.status != 'cancelled':
                     task.mark_failed(error_msg)
+                    db.session.commit()
                     
             # Dispatch any remaining pending tasks
             try:
-                from app import _dispatch_pending_node_tasks
                 _dispatch_pending_node_tasks()
             except Exception:
                 pass
@@ -285,31 +482,79 @@ def run_comsol_simulation(self, task_id, input_file_path, output_file_path):
             # Log error to file if possible
             try:
                 if 'log_file_path' in locals():
-                    with open(log_file_path, 'a', encoding='utf-8') as log_file:
+                    # Same encoding as COMSOL®'s output already in the log
+                    with open(log_file_path, 'a', encoding=locale.getpreferredencoding(),
+                              errors='replace') as log_file:
                         log_file.write(f"\nERROR: {error_msg}\n")
             except Exception:
                 pass
             
             raise e
 
+# unlink() is I/O-bound and releases the GIL, so a few threads overlap it
+CLEANUP_WORKERS = 8
+
+# Directory path -> (its mtime_ns, oldest file mtime, subdirectories) as of
+# the last cleanup walk in this process
+_cleanup_dir_memo = {}
+
+def _stale_files(folder, cutoff_time):
+    """Yield paths of regular files under folder last modified before
+    cutoff_time. os.scandir entries carry the file type from the directory
+    read, and on Windows the mtime too, so most entries cost no extra stat.
+
+    A directory whose own mtime is unchanged since the last walk has had no
+    file added, removed or renamed; if its oldest file was still too new to
+    delete then, it is not read again until the cutoff passes that file."""
+    pending = [os.fspath(folder)]
+    while pending:
+        path = pending.pop()
+        try:
+            dir_mtime = os.stat(path).st_mtime_ns
+        except OSError:
+            _cleanup_dir_memo.pop(path, None)
+            continue
+        memo = _cleanup_dir_memo.get(path)
+        if memo and memo[0] == dir_mtime and memo[1] >= cutoff_time:
+            pending.extend(memo[2])
+            continue
+        oldest, subdirs = float('inf'), []
+        try:
+            with os.scandir(path) as entries:
+                for entry in entries:
+                    try:
+                        if entry.is_dir(follow_symlinks=False):
+                            subdirs.append(entry.path)
+                        elif entry.is_file(follow_symlinks=False):
+                            mtime = entry.stat(follow_symlinks=False).st_mtime
+                            oldest = min(oldest, mtime)
+                            if mtime < cutoff_time:
+                                yield entry.path
+                    except OSError:
+                        continue
+        except OSError:
+            continue
+        _cleanup_dir_memo[path] = (dir_mtime, oldest, subdirs)
+        pending.extend(subdirs)
+
+def _unlink_old_file(path):
+    try:
+        os.unlink(path)
+    except Exception as e:
+        print(f"Failed to delete {path}: {e}")
+
 @celery.task
 def cleanup_old_files():
     """Clean up old result/log files and prune stale SystemStats rows"""
-    import time
-    from pathlib import Path
     from datetime import datetime, timezone, timedelta
 
     # Clean files older than 7 days
     cutoff_time = time.time() - (7 * 24 * 60 * 60)
 
-    for folder in [Config.RESULTS_FOLDER, Config.LOGS_FOLDER]:
-        if folder.exists():
-            for file_path in folder.rglob('*'):
-                if file_path.is_file() and file_path.stat().st_mtime < cutoff_time:
-                    try:
-                        file_path.unlink()
-                    except Exception as e:
-                        print(f"Failed to delete {file_path}: {e}")
+    with ThreadPoolExecutor(max_workers=CLEANUP_WORKERS) as executor:
+        for folder in [Config.RESULTS_FOLDER, Config.LOGS_FOLDER]:
+            if folder.exists():
+                list(executor.map(_unlink_old_file, _stale_files(folder, cutoff_time)))
 
     # Prune SystemStats rows older than 7 days to prevent unbounded table growth
     with app.app_context():
@@ -320,28 +565,13 @@ def cleanup_old_files():
 @celery.task
 def kill_comsol_process(process_id):
     """Kill a COMSOL process by PID"""
-    import psutil
-    
     try:
         if process_id:
             # Kill the process and all its children
-            parent = psutil.Process(process_id)
-            children = parent.children(recursive=True)
-            
-            # Kill children first
-            for child in children:
-                try:
-                    child.kill()
-                except psutil.NoSuchProcess:
-                    pass
-            
-            # Kill parent process
-            try:
-                parent.kill()
+            if _kill_process_tree(process_id):
                 return f"Successfully killed COMSOL process {process_id}"
-            except psutil.NoSuchProcess:
-                return f"Process {process_id} not found (may have already terminated)"
-                
+            return f"Process {process_id} not found (may have already terminated)"
+
     except Exception as e:
         return f"Failed to kill process {process_id}: {str(e)}"
 
@@ -361,7 +591,7 @@ def process_next_pending_task():
         candidate = Task.query.filter(
             Task.status == 'pending',
             Task.assigned_node_id.is_(None),
-        ).order_by(Task.created_at).first()
+        ).order_by(*Task.dispatch_order()).first()
 
         if not candidate:
             return "No pending tasks to process"
@@ -389,15 +619,9 @@ def process_next_pending_task():
         next_task = Task.query.get(candidate.id)
 
         # Start the next task
-        input_file_path = Config.UPLOAD_FOLDER / next_task.user.get_user_folder() / next_task.unique_filename
-
-        # Generate output filename
-        stem = Path(next_task.unique_filename).stem
-        output_filename = f"{stem}_solved.mph"
-        output_file_path = Config.RESULTS_FOLDER / next_task.user.get_user_folder() / output_filename
-
-        # Ensure results directory exists
-        output_file_path.parent.mkdir(parents=True, exist_ok=True)
+        input_file_path = next_task.upload_path
+        output_file_path = next_task.results_dir / next_task.solved_filename
+        # run_comsol_simulation creates the results folder when it starts
 
         # Submit the task to Celery
         celery_task = run_comsol_simulation.delay(
@@ -415,42 +639,20 @@ def process_next_pending_task():
 @celery.task
 def update_system_stats():
     """Update system statistics"""
-    import psutil
     from models import SystemStats
     
     with app.app_context():
-        # Get current task counts
-        pending_count = Task.query.filter_by(status='pending').count()
-        running_count = Task.query.filter_by(status='running').count()
-        
-        # Get today's completed/failed tasks
-        today = datetime.now().date()
-        completed_today = Task.query.filter(
-            Task.status == 'completed',
-            db.func.date(Task.completed_at) == today
-        ).count()
-        
-        failed_today = Task.query.filter(
-            Task.status == 'failed',
-            db.func.date(Task.completed_at) == today
-        ).count()
-        
-        # Get system resource usage
-        cpu_usage = psutil.cpu_percent()
-        memory_usage = psutil.virtual_memory().percent
-        # Use C:\ for Windows, / for Unix
-        disk_path = 'C:\\' if os.name == 'nt' else '/'
-        disk_usage = psutil.disk_usage(disk_path).percent
-        
-        # Calculate average times
-        recent_tasks = Task.query.filter(
-            Task.completed_at >= today,
-            Task.execution_time.isnot(None)
-        ).all()
+        # Task counts and today's averages in one round trip (the same
+        # statement behind /api/stats, uncached here)
+        (pending_count, running_count, completed_today, failed_today,
+         avg_queue_time, avg_execution_time) = Task.stats()
         
-        tasks_with_queue_time = [t for t in recent_tasks if t.queue_time]
-        avg_queue_time = sum(t.queue_time for t in tasks_with_queue_time) / len(tasks_with_queue_time) if tasks_with_queue_time else 0
-        avg_execution_time = sum(t.execution_time for t in recent_tasks) / len(recent_tasks) if recent_tasks else 0
+        # System resource usage from this process's sampler thread (started
+        # on first use), so no psutil call runs on the task itself
+        _start_resource_sampler()
+        cpu_usage = _resource_usage['cpu']
+        memory_usage = _resource_usage['memory']
+        disk_usage = _resource_usage['disk']
         
         # Create new stats record
         stats = SystemStats(